@@ -1,58 +1,55 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
 import httpx
-import redis
 import json
+import asyncio
+import functools
 import logging
-import os
+import secrets
 import uuid
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.datastructures import State
 import time
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("app.log"), logging.StreamHandler()],
+from typing import Optional
+
+from cache_admin import (
+    CACHE_MODEL_TYPES,
+    cache_stats,
+    invalidate_key,
+    invalidate_prefix,
+    record_cache_hit,
+    write_cache,
 )
-logger = logging.getLogger("perplexica-redis-cache")
-
-# 创建FastAPI应用
-app = FastAPI(title="Perplexica Python Backend with Redis Cache")
-
-# 添加CORS中间件
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from pagination import SearchPager, decode_cursor, page_cache_key
+from results import PROJECTION_TOTALS, fetch_projected_results
+from settings import get_settings
+from tracing import (
+    RequestIdFilter,
+    setup_tracing,
+    start_span,
+    trace_headers,
+    trace_request,
 )
 
-# Redis配置
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
-REDIS_DB = int(os.getenv("REDIS_DB", "0"))
-REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
-CACHE_EXPIRATION = int(os.getenv("CACHE_EXPIRATION", "300"))  # 5分钟默认过期时间
-
-# SearxNG配置
-SEARXNG_API_URL = os.getenv("SEARXNG_API_URL", "http://localhost:4000")
-
-# 连接Redis
-redis_client = redis.Redis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    db=REDIS_DB,
-    password=REDIS_PASSWORD,
-    decode_responses=True,
-)
+logger = logging.getLogger("perplexica-redis-cache")
+
+# 路由在create_app中注册到应用上
+router = APIRouter()
 
 
 # 请求模型
 class SearchRequest(BaseModel):
     query: str
-    limit: int = 10
+    limit: int = Field(10, ge=1, le=50)  # 本次返回的结果数量
+    cursor: Optional[str] = None  # 上一次响应返回的nextCursor，为空时从第一页开始
+
+
+class SearchStreamRequest(BaseModel):
+    query: str
+    cursor: Optional[str] = None
+    pages: int = Field(1, ge=1, le=10)  # 本次流式返回的页数
 
 
 class ChatRequest(BaseModel):
@@ -62,6 +59,12 @@ class ChatRequest(BaseModel):
     messages: list = []  # 修改sources为messages
 
 
+class CacheInvalidateRequest(BaseModel):
+    key: Optional[str] = None  # 精确的缓存键
+    query: Optional[str] = None  # 规范化后匹配所有类型的缓存键
+    prefix: Optional[str] = None  # 键前缀，必须以search:或chat:开头
+
+
 # 辅助函数：生成Redis键
 def generate_cache_key(model_type: str, **kwargs):
     """生成一个唯一的缓存键"""
@@ -86,81 +89,110 @@ def format_message(title, url, content):
     }
 
 
+# 辅助函数：获取应用状态中的共享资源（配置、Redis客户端、HTTP连接池等）
+def get_app_state(request: Request) -> State:
+    """返回lifespan中初始化的应用状态"""
+    return request.app.state
+
+
 # 路由：健康检查
-@app.get("/health")
-def health_check():
+@router.get("/health")
+def health_check(state: State = Depends(get_app_state)):
     """健康检查端点"""
-    redis_status = "UP" if redis_client.ping() else "DOWN"
+    try:
+        redis_status = "UP" if state.redis.ping() else "DOWN"
+    except Exception as e:
+        logger.error(f"Redis health check failed: {str(e)}")
+        redis_status = "DOWN"
     return {"status": "healthy", "redis": redis_status, "timestamp": time.time()}
 
 
+# 辅助函数：获取一页SearxNG搜索结果
+async def fetch_search_page(client, settings, query, page):
+    """请求SearxNG的第page页，返回投影、去重后的结果"""
+    # 增量解析并投影SearxNG结果，只缓存需要的字段
+    with start_span("searxng.fetch", {"searxng.page": page}) as span:
+        results, stats = await fetch_projected_results(
+            client,
+            settings,
+            f"{settings.searxng_api_url}/search",
+            params={
+                "q": query,
+                "format": "json",
+                "engines": "google",
+                "pageno": page,
+            },
+            headers=trace_headers(),
+            limit=settings.search_cache_result_limit,
+        )
+        span.set_attribute("searxng.results", len(results))
+        span.set_attribute("searxng.upstream_bytes", stats["upstream_bytes"])
+    return results
+
+
 # 路由：搜索
-@app.post("/api/search")
-async def search(request: SearchRequest):
+@router.post("/api/search")
+async def search(request: SearchRequest, state: State = Depends(get_app_state)):
     # 规范化查询文本
     query = request.query.strip()
 
-    # 为搜索请求生成一个唯一的缓存键 - 使用规范化的查询文本
-    cache_key = generate_cache_key("search", query=query, limit=request.limit)
+    # 为搜索请求生成缓存键前缀 - 每一页在此基础上使用独立的键
+    cache_key = generate_cache_key("search", query=query)
     logger.info(f"Generated cache key for search query: {query}, key: {cache_key}")
 
-    # 尝试从Redis获取缓存的结果
-    cached_result = redis_client.get(cache_key)
-
-    if cached_result:
-        # 缓存命中
-        logger.info(f"Cache HIT for search query: {query}")
-        try:
-            result = json.loads(cached_result)
-            # 确保前端知道这是缓存结果
-            result["fromCache"] = True
-            logger.info(f"Returning cached search result")
-            return result
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding cached search result: {e}")
-            # 缓存数据损坏，删除并继续处理
-            redis_client.delete(cache_key)
-
-    # 缓存未命中
-    logger.info(f"Cache MISS for search query: {query}")
+    try:
+        page, offset = decode_cursor(request.cursor, query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{SEARXNG_API_URL}/search",
-                params={
-                    "q": query,
-                    "format": "json",
-                    "engines": "google",
-                    "limit": request.limit,
-                },
-            )
-            response.raise_for_status()
-            result = response.json()
+    try:
+        results, next_cursor, from_cache = await state.search_pager.collect(
+            query, cache_key, page, offset, request.limit
+        )
+    except (httpx.RequestError, httpx.HTTPStatusError, ValueError) as e:
+        logger.error(f"Error fetching search results: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error fetching search results")
+
+    logger.info(
+        f"Returning {len(results)} search results from page {page} "
+        f"(fromCache: {from_cache})"
+    )
+    return {
+        "query": query,
+        "results": results,
+        "page": page,
+        "nextCursor": next_cursor,
+        "fromCache": from_cache,
+    }
 
-            # 添加fromCache标记
-            result["fromCache"] = False
 
-            # 标准化为messages格式，如果API返回的是旧格式
-            if "sources" in result and not "messages" in result:
-                result["messages"] = result["sources"]
+# 路由：流式搜索
+@router.post("/api/search/stream")
+async def search_stream(
+    request: SearchStreamRequest, state: State = Depends(get_app_state)
+):
+    """以NDJSON格式逐页返回搜索结果，每获取到一页就立即输出"""
+    query = request.query.strip()
+    cache_key = generate_cache_key("search", query=query)
 
-            # 将结果存储到Redis，设置过期时间
-            cached_json = json.dumps(result, ensure_ascii=False)
-            redis_client.setex(cache_key, CACHE_EXPIRATION, cached_json)
-            logger.info(f"Saved search results to Redis cache with key: {cache_key}")
+    try:
+        page, offset = decode_cursor(request.cursor, query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-            return result
-        except httpx.RequestError as e:
-            logger.error(f"Error fetching search results: {str(e)}")
-            raise HTTPException(status_code=500, detail="Error fetching search results")
+    return StreamingResponse(
+        state.search_pager.stream(query, cache_key, page, offset, request.pages),
+        media_type="application/x-ndjson",
+    )
 
 
 # 路由：聊天
-@app.post("/api/chat")
-async def chat(request: ChatRequest):
+@router.post("/api/chat")
+async def chat(request: ChatRequest, state: State = Depends(get_app_state)):
     # 简化参数处理逻辑 - 只需要query参数
     # 其他参数设为可选，用于保存结果到缓存
+    redis_client = state.redis
+    settings = state.settings
     query = request.query.strip()  # 去除首尾空格
     context = request.context or ""
 
@@ -169,13 +201,17 @@ async def chat(request: ChatRequest):
     logger.info(f"Generated cache key for query: {query}, key: {cache_key}")
 
     # 尝试从Redis获取缓存的结果
-    cached_result = redis_client.get(cache_key)
+    with start_span("cache.lookup", {"cache.key": cache_key}) as span:
+        cached_result = redis_client.get(cache_key)
+        span.set_attribute("cache.hit", bool(cached_result))
 
     if cached_result:
         # 缓存命中
         logger.info(f"Cache HIT for chat query: {query}")
+        record_cache_hit(redis_client, cache_key)
         try:
-            result = json.loads(cached_result)
+            with start_span("cache.decode"):
+                result = json.loads(cached_result)
             # 显式设置fromCache标记，确保前端能识别
             result["fromCache"] = True
 
@@ -268,8 +304,12 @@ async def chat(request: ChatRequest):
                     cache_data["messages"].append(source)
 
         # 存储到Redis缓存 - 确保以UTF-8编码的JSON字符串存储
-        cached_json = json.dumps(cache_data, ensure_ascii=False)
-        redis_client.setex(cache_key, CACHE_EXPIRATION, cached_json)
+        with start_span("cache.encode"):
+            cached_json = json.dumps(cache_data, ensure_ascii=False)
+        with start_span("cache.write", {"cache.key": cache_key}):
+            write_cache(
+                redis_client, cache_key, cached_json, settings.cache_expiration
+            )
 
         logger.info(f"Saved response to Redis cache with key: {cache_key}")
 
@@ -281,39 +321,39 @@ async def chat(request: ChatRequest):
         }
 
     # 调用 SearxNG 搜索，并构建结果
-    searxng_results = {}
+    results = []
     messages = []
 
     try:
-        # 调用 SearxNG 搜索API
-        async with httpx.AsyncClient() as client:
-            search_response = await client.get(
-                f"{SEARXNG_API_URL}/search",
+        # 调用 SearxNG 搜索API，增量解析并投影结果
+        with start_span("searxng.fetch") as span:
+            results, stats = await fetch_projected_results(
+                state.http_client,
+                settings,
+                f"{settings.searxng_api_url}/search",
                 params={
                     "q": query,
                     "format": "json",
                     "engines": "google",
-                    "limit": 5,  # 限制结果数量
+                    "limit": settings.chat_result_limit,
                 },
+                headers=trace_headers(),
+                # 去重后截断，只格式化需要的结果
+                limit=settings.chat_result_limit,
             )
-            search_response.raise_for_status()
-            searxng_results = search_response.json()
-
-            # 处理搜索结果，提取messages
-            if "results" in searxng_results and isinstance(
-                searxng_results["results"], list
-            ):
-                for item in searxng_results["results"]:
-                    content = (
-                        item.get("content", "")
-                        or item.get("snippet", "")
-                        or "No content available"
-                    )
-                    title = item.get("title", "相关结果")
-                    url = item.get("url", "#")
-                    message = format_message(title, url, content)
-                    messages.append(message)
-                logger.info(f"Extracted {len(messages)} messages from SearxNG results")
+            span.set_attribute("searxng.results", len(results))
+            span.set_attribute("searxng.upstream_bytes", stats["upstream_bytes"])
+
+        # 处理搜索结果，提取messages
+        with start_span("messages.extract") as span:
+            for item in results:
+                content = item["content"] or "No content available"
+                title = item["title"] or "相关结果"
+                url = item["url"] or "#"
+                message = format_message(title, url, content)
+                messages.append(message)
+            span.set_attribute("messages.count", len(messages))
+        logger.info(f"Extracted {len(messages)} messages from SearxNG results")
     except Exception as e:
         logger.error(f"Error fetching search results from SearxNG: {str(e)}")
 
@@ -330,8 +370,8 @@ async def chat(request: ChatRequest):
         for i, message in enumerate(messages):
             response_text += f"\n- [{i+1}] {message['metadata']['title']}"
 
-    # 生成context内容
-    context_content = json.dumps(searxng_results)
+    # 生成context内容 - 只包含投影后的结果，不再嵌入完整的SearxNG响应
+    context_content = json.dumps({"results": results}, ensure_ascii=False)
 
     # 构建完整的响应对象
     response_data = {
@@ -344,16 +384,211 @@ async def chat(request: ChatRequest):
     }
 
     # 将结果存入Redis缓存
-    cached_json = json.dumps(response_data, ensure_ascii=False)
-    redis_client.setex(cache_key, CACHE_EXPIRATION, cached_json)
+    with start_span("cache.encode"):
+        cached_json = json.dumps(response_data, ensure_ascii=False)
+    with start_span("cache.write", {"cache.key": cache_key}):
+        write_cache(redis_client, cache_key, cached_json, settings.cache_expiration)
 
-    logger.info(f"Saved search results to Redis cache with key: {cache_key}")
+    logger.info(
+        f"Saved search results to Redis cache with key: {cache_key} "
+        f"({len(cached_json.encode('utf-8'))} bytes)"
+    )
 
     return response_data
 
 
+# 辅助函数：校验缓存管理接口的访问令牌
+def verify_admin_token(request: Request):
+    """校验X-Admin-Token请求头，未配置令牌时管理接口不可用"""
+    admin_token = request.app.state.settings.cache_admin_token
+    if not admin_token:
+        raise HTTPException(
+            status_code=403,
+            detail="Cache admin API is disabled, set CACHE_ADMIN_TOKEN to enable it",
+        )
+    if not secrets.compare_digest(
+        request.headers.get("X-Admin-Token", "").encode("utf-8"),
+        admin_token.encode("utf-8"),
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+# 路由：缓存失效
+@router.post("/api/cache/invalidate", dependencies=[Depends(verify_admin_token)])
+def invalidate_cache(
+    body: CacheInvalidateRequest, state: State = Depends(get_app_state)
+):
+    """按精确键、规范化查询或前缀失效缓存"""
+    redis_client = state.redis
+
+    if not (body.key or body.query or body.prefix):
+        raise HTTPException(
+            status_code=400, detail="One of key, query or prefix is required"
+        )
+
+    deleted = 0
+    if body.key:
+        deleted += invalidate_key(redis_client, body.key)
+    if body.query:
+        # 查询文本按与请求相同的规则生成每种类型的缓存键
+        for model_type in CACHE_MODEL_TYPES:
+            cache_key = generate_cache_key(model_type, query=body.query)
+            deleted += invalidate_key(redis_client, cache_key)
+        # 搜索结果按页缓存，同时删除该查询的所有分页
+        search_key = generate_cache_key("search", query=body.query)
+        deleted += invalidate_prefix(redis_client, page_cache_key(search_key, ""))
+    if body.prefix:
+        try:
+            deleted += invalidate_prefix(redis_client, body.prefix)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Cache invalidation removed {deleted} keys")
+    return {"status": "success", "deleted": deleted}
+
+
+# 路由：缓存统计
+@router.get("/api/cache/stats", dependencies=[Depends(verify_admin_token)])
+def get_cache_stats(
+    top: int = Query(10, ge=1, le=100),  # 返回的热点键数量
+    sample: int = Query(20, ge=1, le=200),  # 每种类型采样内存占用的键数量
+    state: State = Depends(get_app_state),
+):
+    """返回缓存键数量、内存占用采样和热点键"""
+    stats = cache_stats(state.redis, top_n=top, sample_size=sample)
+    stats["projection"] = dict(PROJECTION_TOTALS)
+    stats["timestamp"] = time.time()
+    return stats
+
+
+# 辅助函数：配置日志
+def configure_logging(settings):
+    """配置日志 - 每条日志带上请求ID以便与追踪数据关联
+
+    根日志器已有handler时basicConfig不会重复配置，因此可以安全地多次调用。
+    """
+    log_handlers = [logging.StreamHandler()]
+    if settings.log_file:
+        log_handlers.append(logging.FileHandler(settings.log_file))
+    for handler in log_handlers:
+        handler.addFilter(RequestIdFilter())
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s",
+        handlers=log_handlers,
+    )
+
+
+# 辅助函数：预热连接池
+async def prewarm_connections(state):
+    """启动时并发建立Redis和SearxNG连接，避免首批请求承担建连开销"""
+    count = state.settings.prewarm_connections
+    if count == 0:
+        return
+
+    # 同步Redis客户端在线程中并发ping，使连接池建立多条连接
+    try:
+        await asyncio.gather(
+            *(asyncio.to_thread(state.redis.ping) for _ in range(count))
+        )
+    except Exception as e:
+        logger.warning(f"Redis pre-warm failed: {str(e)}")
+
+    try:
+        await asyncio.gather(
+            *(
+                state.http_client.get(f"{state.settings.searxng_api_url}/healthz")
+                for _ in range(count)
+            )
+        )
+    except httpx.HTTPError as e:
+        logger.warning(f"SearxNG pre-warm failed: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时初始化配置、日志、追踪和连接池，关闭时释放资源"""
+    start_time = time.perf_counter()
+    state = app.state
+    if state.settings is None:
+        state.settings = get_settings()
+    settings = state.settings
+
+    configure_logging(settings)
+    tracer_provider = setup_tracing(settings)
+
+    # 延迟导入Redis客户端，导入app模块时不加载
+    import redis
+
+    state.redis = redis.Redis(
+        connection_pool=redis.ConnectionPool(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            db=settings.redis_db,
+            password=settings.redis_password,
+            max_connections=settings.redis_max_connections,
+            decode_responses=True,
+        )
+    )
+    state.http_client = httpx.AsyncClient(
+        timeout=settings.searxng_timeout,
+        limits=httpx.Limits(
+            max_connections=settings.searxng_max_connections,
+            max_keepalive_connections=settings.searxng_max_connections,
+        ),
+    )
+    # 搜索结果分页器：每页独立缓存，并在后台预取下一页
+    state.search_pager = SearchPager(
+        state.redis,
+        functools.partial(fetch_search_page, state.http_client, settings),
+        settings.cache_expiration,
+        settings.search_max_pages,
+    )
+
+    await prewarm_connections(state)
+    logger.info(
+        f"Startup completed in {(time.perf_counter() - start_time) * 1000:.1f}ms"
+    )
+
+    try:
+        yield
+    finally:
+        await state.http_client.aclose()
+        state.redis.close()
+        if tracer_provider is not None:
+            tracer_provider.shutdown()
+
+
+# 创建FastAPI应用
+def create_app(settings=None):
+    """创建FastAPI应用，不做任何I/O；配置在启动时读取并校验，连接在lifespan中建立"""
+    app = FastAPI(title="Perplexica Python Backend with Redis Cache", lifespan=lifespan)
+    app.state.settings = settings
+
+    # 添加追踪中间件：提取traceparent、创建请求span并记录耗时
+    app.middleware("http")(trace_request)
+
+    # 添加CORS中间件
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Request-ID"],
+    )
+
+    app.include_router(router)
+    return app
+
+
+app = create_app()
+
+
 # 主程序入口
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        "app:app", host="0.0.0.0", port=8000, reload=get_settings().app_reload
+    )
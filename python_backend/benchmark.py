@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+import logging
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler()],
+)
+logger = logging.getLogger("benchmark")
+
+# 每个基准测试的默认迭代次数
+ITERATIONS = 2000
+
+# 模拟一次聊天请求经过的各个阶段
+REQUEST_STAGES = (
+    "cache.lookup",
+    "searxng.fetch",
+    "messages.extract",
+    "cache.encode",
+    "cache.write",
+)
+
+
+# 辅助函数：打印分隔线
+def print_separator(title="", char="=", length=80):
+    """打印分隔线，可选中间显示标题"""
+    if title:
+        side_length = (length - len(title) - 2) // 2
+        logger.info(f"{char * side_length} {title} {char * side_length}")
+    else:
+        logger.info(char * length)
+
+
+# 辅助函数：计时
+def measure(func, iterations=ITERATIONS):
+    """执行func若干次，返回平均每次耗时（微秒）"""
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start_time) / iterations * 1_000_000
+
+
+def _build_traced_app():
+    """构建一个只包含追踪中间件和各阶段span的最小应用，用于测量每个请求的追踪开销"""
+    from fastapi import FastAPI
+
+    from tracing import start_span, trace_request
+
+    app = FastAPI()
+    app.middleware("http")(trace_request)
+
+    @app.get("/stages")
+    def stages():
+        for stage in REQUEST_STAGES:
+            with start_span(stage, {"cache.key": "chat:benchmark"}):
+                pass
+        return {"ok": True}
+
+    return app
+
+
+def bench_tracing_overhead():
+    """测量span关闭、仅传播和导出span三种情况下的请求耗时
+
+    三种情况使用同一个应用和中间件，只有span的创建方式不同，并在测量期间关闭日志，
+    因此差值只反映span本身的开销。
+    """
+    print_separator("追踪开销基准测试")
+    try:
+        from fastapi.testclient import TestClient
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import (
+            BatchSpanProcessor,
+            SpanExporter,
+            SpanExportResult,
+        )
+    except ImportError as e:
+        logger.warning(f"跳过追踪基准测试，缺少依赖: {e}")
+        return
+
+    import tracing
+    from settings import Settings
+
+    class DiscardSpanExporter(SpanExporter):
+        """丢弃所有span，只保留处理和序列化以外的开销"""
+
+        def export(self, spans):
+            return SpanExportResult.SUCCESS
+
+    headers = {"traceparent": "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"}
+    iterations = ITERATIONS // 4
+
+    client = TestClient(_build_traced_app())
+
+    def request():
+        client.get("/stages", headers=headers)
+
+    # 中间件每个请求都会写一条日志，测量期间关闭日志以免掩盖span的开销
+    logging.disable(logging.INFO)
+    try:
+        # 未导入OpenTelemetry时中间件和start_span都使用空span
+        tracing.trace = None
+        baseline = measure(request, iterations)
+
+        # 只导入OpenTelemetry API，不注册导出器
+        tracing.setup_tracing(Settings(tracing_exporter="none"))
+        noop = measure(request, iterations)
+
+        provider = TracerProvider()
+        provider.add_span_processor(BatchSpanProcessor(DiscardSpanExporter()))
+        trace.set_tracer_provider(provider)
+        exported = measure(request, iterations)
+        provider.shutdown()
+    finally:
+        logging.disable(logging.NOTSET)
+
+    logger.info(f"中间件（不创建span）: {baseline:.1f}µs/请求")
+    logger.info(f"仅传播traceparent（无导出器）: {noop:.1f}µs/请求")
+    logger.info(f"导出span: {exported:.1f}µs/请求")
+
+    logger.info(
+        f"追踪开销: 仅传播 {noop - baseline:+.1f}µs, 导出 {exported - baseline:+.1f}µs "
+        f"({len(REQUEST_STAGES) + 1} 个span/请求)"
+    )
+
+
+# 构造模拟摘要用的词表
+WORDS = (
+    "redis cache search query result engine memory latency python server "
+    "index page ranking token vector stream batch request response network"
+).split()
+
+
+def _build_result_payload(pages=50, engines=("google", "bing", "duckduckgo")):
+    """构建一个模拟多引擎返回的结果列表，包含URL变体和近似重复的摘要"""
+    payload = []
+    for engine_index, engine in enumerate(engines):
+        for page in range(pages):
+            # 同一页面在不同引擎中的URL写法不同：www前缀、协议、跟踪参数和末尾斜杠
+            host = "www.example.com" if engine_index % 2 else "example.com"
+            url = f"https://{host}/articles/{page}/"
+            if engine_index == 2:
+                url = f"http://example.com/articles/{page}?utm_source={engine}"
+            # 以页码为种子生成摘要，保证同一页面在各引擎中的摘要一致
+            content = " ".join(random.Random(page).choices(WORDS, k=30))
+            if engine_index:
+                content += "."
+            payload.append(
+                {
+                    "title": f"Article {page}",
+                    "url": url,
+                    "content": content,
+                    "engine": engine,
+                    "score": 1.0 / (page + 1),
+                }
+            )
+            # 每10个页面有一个被其他站点转载的副本，URL不同但摘要几乎相同
+            if engine_index == 0 and page % 10 == 0:
+                payload.append(
+                    {
+                        "title": f"Article {page} (mirror)",
+                        "url": f"https://mirror.example.org/{page}",
+                        "content": content + " via mirror",
+                        "engine": engine,
+                        "score": 0.5 / (page + 1),
+                    }
+                )
+    return payload
+
+
+def bench_result_pipeline():
+    """测量结果后处理流水线在100+条结果上的耗时和去重效果"""
+    print_separator("结果后处理基准测试")
+    from results import ResultPipeline
+    from settings import get_settings
+
+    settings = get_settings()
+    batch_size = settings.result_batch_size
+
+    payload = _build_result_payload()
+    logger.info(f"结果数量: {len(payload)}")
+
+    def run(limit):
+        pipeline = ResultPipeline(settings, limit=limit)
+        for start in range(0, len(payload), batch_size):
+            # 流水线会改写url，因此每次都使用副本
+            batch = [dict(item) for item in payload[start : start + batch_size]]
+            if pipeline.add_batch(batch):
+                break
+        return pipeline
+
+    def copy_only():
+        for start in range(0, len(payload), batch_size):
+            [dict(item) for item in payload[start : start + batch_size]]
+
+    baseline = measure(copy_only, ITERATIONS // 10)
+    for limit in (None, 10):
+        pipeline = run(limit)
+        elapsed = measure(lambda: run(limit), ITERATIONS // 10) - baseline
+        logger.info(
+            f"limit={limit}: {elapsed:.1f}µs/批量结果, 保留 {len(pipeline.results)} 条, "
+            f"URL重复 {pipeline.duplicates} 条, 近似重复 {pipeline.near_duplicates} 条"
+        )
+
+
+# 内存基准测试中模拟的网络数据块大小
+CHUNK_SIZE = 64 * 1024
+
+
+def _searxng_transport(body):
+    """返回一个把body按CHUNK_SIZE分块返回的模拟SearxNG传输层"""
+    import httpx
+
+    class ChunkedStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for start in range(0, len(body), CHUNK_SIZE):
+                yield body[start : start + CHUNK_SIZE]
+
+    return httpx.MockTransport(
+        lambda request: httpx.Response(200, stream=ChunkedStream())
+    )
+
+
+def _trace_peak(coroutine_func):
+    """在tracemalloc下运行协程，返回(结果, 内存峰值字节数)"""
+    import asyncio
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        result = asyncio.run(coroutine_func())
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_projection_memory(results_count=2000):
+    """用tracemalloc测量增量解析和整体解析一个大SearxNG响应的内存峰值"""
+    print_separator("响应解析内存基准测试")
+    import json
+
+    import httpx
+
+    from results import _ijson, fetch_projected_results, project_result
+    from settings import get_settings
+
+    if _ijson() is None:
+        logger.warning("跳过内存基准测试，未安装ijson")
+        return
+
+    settings = get_settings()
+    # 每条结果都带有较长的摘要和投影时会被丢弃的字段，与SearxNG的真实响应类似
+    body = json.dumps(
+        {
+            "query": "benchmark",
+            "results": [
+                {
+                    "title": f"Result {i}",
+                    "url": f"https://example.com/{i}",
+                    "content": " ".join(random.Random(i).choices(WORDS, k=200)),
+                    "engine": "google",
+                    "engines": ["google"],
+                    "positions": [i],
+                    "parsed_url": ["https", "example.com", f"/{i}", "", "", ""],
+                    "score": 1.0,
+                }
+                for i in range(results_count)
+            ],
+        }
+    ).encode("utf-8")
+    logger.info(f"响应大小: {len(body) / 1024 / 1024:.1f}MB, {results_count} 条结果")
+    transport = _searxng_transport(body)
+
+    async def streamed():
+        async with httpx.AsyncClient(transport=transport) as client:
+            results, _ = await fetch_projected_results(
+                client, settings, "http://searxng/search", params={}
+            )
+            return results
+
+    async def whole_body():
+        # 改动前的做法：读取完整响应体后整体解析，再逐条投影
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.get("http://searxng/search")
+            return [
+                project_result(item, settings) for item in response.json()["results"]
+            ]
+
+    # 只统计解析过程的内存，日志输出不计入
+    logging.disable(logging.INFO)
+    try:
+        streamed_results, streamed_peak = _trace_peak(streamed)
+        whole_results, whole_peak = _trace_peak(whole_body)
+    finally:
+        logging.disable(logging.NOTSET)
+    logger.info(
+        f"增量解析: 内存峰值 {streamed_peak / 1024 / 1024:.1f}MB, "
+        f"保留 {len(streamed_results)} 条"
+    )
+    logger.info(
+        f"整体解析: 内存峰值 {whole_peak / 1024 / 1024:.1f}MB, "
+        f"保留 {len(whole_results)} 条"
+    )
+
+
+# 启动基准测试在app.py所在目录中启动子进程
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 等待服务启动的最长时间（秒）
+STARTUP_TIMEOUT = 30
+
+
+def _free_port():
+    """获取一个空闲的本地端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench_startup(runs=5):
+    """测量导入app模块的耗时，以及从启动进程到服务第一个请求的耗时"""
+    print_separator("启动耗时基准测试")
+    import httpx
+
+    import_times = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [
+                sys.executable,
+                "-c",
+                "import time; t = time.perf_counter(); import app; "
+                "print(time.perf_counter() - t)",
+            ],
+            cwd=BACKEND_DIR,
+            text=True,
+        )
+        import_times.append(float(output.strip().splitlines()[-1]) * 1000)
+    logger.info(f"导入app模块: 中位数 {statistics.median(import_times):.1f}ms")
+
+    first_request_times = []
+    for _ in range(runs):
+        port = _free_port()
+        start_time = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port)],
+            cwd=BACKEND_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env={**os.environ, "LOG_FILE": ""},
+        )
+        try:
+            while time.perf_counter() - start_time < STARTUP_TIMEOUT:
+                try:
+                    # Redis不可用时健康检查也会返回，只关心服务能否响应请求
+                    httpx.get(f"http://127.0.0.1:{port}/health", timeout=1)
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            else:
+                logger.error("服务未能在超时时间内启动")
+                return
+            first_request_times.append((time.perf_counter() - start_time) * 1000)
+        finally:
+            process.terminate()
+            process.wait()
+    logger.info(
+        f"启动到服务第一个请求: 中位数 {statistics.median(first_request_times):.1f}ms"
+    )
+
+
+BENCHMARKS = {
+    "tracing": bench_tracing_overhead,
+    "results": bench_result_pipeline,
+    "memory": bench_projection_memory,
+    "startup": bench_startup,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        if name not in BENCHMARKS:
+            logger.error(f"未知的基准测试: {name}，可选: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        BENCHMARKS[name]()
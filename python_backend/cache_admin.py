@@ -0,0 +1,172 @@
+import logging
+import time
+
+logger = logging.getLogger("perplexica-redis-cache")
+
+# 允许被管理的缓存键前缀
+CACHE_MODEL_TYPES = ("search", "chat")
+
+# 二级索引：按过期时间排序的键集合，以及按命中次数排序的热点键集合
+CACHE_INDEX_KEY = "cache:index:{model_type}"
+CACHE_HITS_KEY = "cache:hits"
+# 清理热点集合时临时存放所有未过期键的集合
+CACHE_LIVE_KEY = "cache:live"
+
+# 热点集合最多保留的键数量，超出时移除命中次数最少的键
+CACHE_HITS_MAX_KEYS = 10000
+
+# SCAN/UNLINK 每批处理的键数量
+SCAN_BATCH_SIZE = 500
+
+
+def _model_type_of(key):
+    """从缓存键中取出模型类型前缀，未知前缀返回None"""
+    model_type = key.split(":", 1)[0]
+    return model_type if model_type in CACHE_MODEL_TYPES else None
+
+
+def _escape_pattern(value):
+    """转义SCAN MATCH模式中的通配符"""
+    for char in ("\\", "*", "?", "[", "]"):
+        value = value.replace(char, "\\" + char)
+    return value
+
+
+def write_cache(redis_client, key, value, expiration):
+    """写入缓存并以过期时间为分数更新二级索引
+
+    SETEX、索引更新和已过期索引项的清理在同一个pipeline中发送，只需一次往返；
+    热点集合中过期的键由prune_index清理。
+    """
+    model_type = _model_type_of(key)
+    if model_type is None:
+        redis_client.setex(key, expiration, value)
+        return
+    index_key = CACHE_INDEX_KEY.format(model_type=model_type)
+    now = time.time()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.setex(key, expiration, value)
+    pipe.zadd(index_key, {key: now + expiration})
+    pipe.zremrangebyscore(index_key, "-inf", now)
+    pipe.execute()
+
+
+def record_cache_hit(redis_client, key):
+    """缓存命中后更新命中计数，热点集合超出上限时移除命中最少的键
+
+    GET不会延长键的TTL，因此命中时不改动索引中的过期时间。
+    """
+    if _model_type_of(key) is None:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zincrby(CACHE_HITS_KEY, 1, key)
+    pipe.zremrangebyrank(CACHE_HITS_KEY, 0, -(CACHE_HITS_MAX_KEYS + 1))
+    pipe.execute()
+
+
+def _forget_keys(redis_client, keys):
+    """删除一批缓存键并从二级索引中移除，返回实际删除的数量"""
+    if not keys:
+        return 0
+    by_type = {}
+    for key in keys:
+        model_type = _model_type_of(key)
+        if model_type is not None:
+            by_type.setdefault(model_type, []).append(key)
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.unlink(*keys)
+    for model_type, typed_keys in by_type.items():
+        pipe.zrem(CACHE_INDEX_KEY.format(model_type=model_type), *typed_keys)
+    pipe.zrem(CACHE_HITS_KEY, *keys)
+    return pipe.execute()[0]
+
+
+def invalidate_key(redis_client, key):
+    """按精确键失效缓存"""
+    return _forget_keys(redis_client, [key])
+
+
+def invalidate_prefix(redis_client, prefix):
+    """按前缀失效缓存，使用SCAN分批遍历并用UNLINK非阻塞删除"""
+    if _model_type_of(prefix) is None:
+        raise ValueError(
+            f"Prefix must start with one of: "
+            f"{', '.join(t + ':' for t in CACHE_MODEL_TYPES)}"
+        )
+
+    deleted = 0
+    batch = []
+    for key in redis_client.scan_iter(
+        match=f"{_escape_pattern(prefix)}*", count=SCAN_BATCH_SIZE
+    ):
+        batch.append(key)
+        if len(batch) >= SCAN_BATCH_SIZE:
+            deleted += _forget_keys(redis_client, batch)
+            batch = []
+    deleted += _forget_keys(redis_client, batch)
+
+    logger.info(f"Invalidated {deleted} cache keys with prefix: {prefix}")
+    return deleted
+
+
+def prune_index(redis_client):
+    """移除二级索引和热点集合中所有已经过期的键，返回从索引中移除的数量"""
+    now = time.time()
+    index_keys = [
+        CACHE_INDEX_KEY.format(model_type=model_type)
+        for model_type in CACHE_MODEL_TYPES
+    ]
+    pipe = redis_client.pipeline(transaction=True)
+    for index_key in index_keys:
+        pipe.zremrangebyscore(index_key, "-inf", now)
+    # 热点集合只保留仍在索引中的键：合并所有索引后与热点集合求交集，命中次数不变
+    pipe.zunionstore(CACHE_LIVE_KEY, {index_key: 0 for index_key in index_keys})
+    pipe.zinterstore(CACHE_HITS_KEY, {CACHE_HITS_KEY: 1, CACHE_LIVE_KEY: 0})
+    pipe.delete(CACHE_LIVE_KEY)
+    return sum(pipe.execute()[: len(index_keys)])
+
+
+def cache_stats(redis_client, top_n=10, sample_size=20):
+    """基于二级索引统计缓存键数量、内存占用采样和热点键"""
+    pruned = prune_index(redis_client)
+
+    key_counts = {}
+    memory = {}
+    for model_type in CACHE_MODEL_TYPES:
+        index_key = CACHE_INDEX_KEY.format(model_type=model_type)
+        count = redis_client.zcard(index_key)
+        key_counts[model_type] = count
+
+        # 对最近写入（最晚过期）的键采样内存占用，并按键数量估算总量
+        sampled = redis_client.zrevrange(index_key, 0, max(sample_size, 1) - 1)
+        pipe = redis_client.pipeline(transaction=False)
+        for key in sampled:
+            pipe.memory_usage(key)
+        # MEMORY USAGE可能被ACL禁用，失败的采样直接忽略
+        usages = [
+            usage
+            for usage in pipe.execute(raise_on_error=False)
+            if isinstance(usage, int)
+        ]
+        average = sum(usages) / len(usages) if usages else 0
+        memory[model_type] = {
+            "sampled_keys": len(usages),
+            "average_bytes": round(average),
+            "estimated_total_bytes": round(average * count),
+        }
+
+    hot_keys = [
+        {"key": key, "hits": int(hits)}
+        for key, hits in redis_client.zrevrange(
+            CACHE_HITS_KEY, 0, max(top_n, 1) - 1, withscores=True
+        )
+    ]
+
+    return {
+        "keyCounts": key_counts,
+        "totalKeys": sum(key_counts.values()),
+        "memory": memory,
+        "hotKeys": hot_keys,
+        "prunedIndexEntries": pruned,
+    }
@@ -0,0 +1,2 @@
+# test_cache.py是需要启动服务、Redis和SearxNG的集成测试脚本，用python3 test_cache.py单独运行
+collect_ignore = ["test_cache.py"]
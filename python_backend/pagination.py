@@ -0,0 +1,223 @@
+import asyncio
+import base64
+import binascii
+import json
+import logging
+
+from cache_admin import record_cache_hit, write_cache
+from results import canonicalize_url
+from tracing import start_span
+
+logger = logging.getLogger("perplexica-redis-cache")
+
+
+def page_cache_key(base_key, page):
+    """生成某一页搜索结果的缓存键"""
+    return f"{base_key}:page:{page}"
+
+
+def encode_cursor(query, page, offset):
+    """把页码和页内偏移编码为不透明的游标"""
+    payload = json.dumps(
+        {"q": query.strip().lower(), "p": page, "o": offset},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, query):
+    """解析游标，返回(页码, 页内偏移)；游标无效或与查询不匹配时抛出ValueError"""
+    if not cursor:
+        return 1, 0
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        page, offset = int(payload["p"]), int(payload["o"])
+        cursor_query = payload["q"]
+    except (binascii.Error, ValueError, OverflowError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if cursor_query != query.strip().lower():
+        raise ValueError("Cursor does not belong to this query")
+    if page < 1 or offset < 0:
+        raise ValueError("Invalid cursor position")
+    return page, offset
+
+
+class SearchPager:
+    """按页获取、缓存和预取搜索结果
+
+    每一页使用独立的缓存键；同一页的并发请求和后台预取共享同一个上游请求，
+    因此每页最多只会向SearxNG请求一次。SearxNG的相邻页面经常重叠，第N页写入缓存前
+    会按第1..N-1页结果的去重键过滤，这些键和结果一起保存在每一页的缓存中。
+    """
+
+    def __init__(self, redis_client, fetch_page, expiration, max_pages):
+        # fetch_page(query, page) -> 该页投影、页内去重后的结果列表
+        self.redis_client = redis_client
+        self.fetch_page = fetch_page
+        self.expiration = expiration
+        self.max_pages = max_pages
+        self._inflight = {}
+        self._background = set()
+
+    def _read_cache(self, cache_key):
+        """读取一页缓存，返回{"results", "keys", "exhausted"}，不存在或损坏时返回None"""
+        with start_span("cache.lookup", {"cache.key": cache_key}) as span:
+            cached_result = self.redis_client.get(cache_key)
+            span.set_attribute("cache.hit", bool(cached_result))
+        if not cached_result:
+            return None
+        try:
+            with start_span("cache.decode"):
+                cached = json.loads(cached_result)
+                # 缺少keys的旧格式缓存同样视为损坏，重新获取
+                page_data = {
+                    "results": cached["results"],
+                    "keys": cached["keys"],
+                    "exhausted": cached["exhausted"],
+                }
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logger.error(f"Error decoding cached search page {cache_key}: {e}")
+            # 缓存数据损坏，删除并重新获取
+            self.redis_client.delete(cache_key)
+            return None
+        record_cache_hit(self.redis_client, cache_key)
+        return page_data
+
+    async def _fetch_and_cache(self, query, base_key, page, cache_key):
+        """向上游请求一页结果，按之前各页的去重键过滤后写入缓存"""
+        seen_keys = []
+        if page > 1:
+            # 之前的页面通常已经缓存或正在预取；不在缓存中时会先获取它
+            previous, _ = await self.get_page(query, base_key, page - 1)
+            seen_keys = previous["keys"]
+        fetched = await self.fetch_page(query, page)
+
+        seen = set(seen_keys)
+        keys = list(seen_keys)
+        results = []
+        for result in fetched:
+            key = canonicalize_url(result["url"])[1]
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+                keys.append(key)
+            results.append(result)
+        if len(results) < len(fetched):
+            logger.info(
+                f"Dropped {len(fetched) - len(results)} results of search page {page} "
+                f"already returned on earlier pages"
+            )
+
+        # 上游没有返回任何结果才表示结果已经取完；整页都是重复结果时继续翻页
+        page_data = {"results": results, "keys": keys, "exhausted": not fetched}
+        with start_span("cache.encode"):
+            cached_json = json.dumps(
+                {"query": query, "page": page, **page_data}, ensure_ascii=False
+            )
+        with start_span("cache.write", {"cache.key": cache_key}):
+            write_cache(self.redis_client, cache_key, cached_json, self.expiration)
+        logger.info(f"Saved search page {page} to Redis cache with key: {cache_key}")
+        return page_data
+
+    def _page_task(self, query, base_key, page, cache_key):
+        """返回正在获取该页的任务，没有时创建一个"""
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(
+                self._fetch_and_cache(query, base_key, page, cache_key)
+            )
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        return task
+
+    async def get_page(self, query, base_key, page):
+        """获取一页结果，返回({"results", "keys", "exhausted"}, 是否来自缓存)"""
+        if page > self.max_pages:
+            return {"results": [], "keys": [], "exhausted": True}, True
+        cache_key = page_cache_key(base_key, page)
+        if cache_key not in self._inflight:
+            page_data = self._read_cache(cache_key)
+            if page_data is not None:
+                logger.info(f"Cache HIT for search page {page}: {query}")
+                return page_data, True
+        logger.info(f"Cache MISS for search page {page}: {query}")
+        # shield避免客户端断开时取消其他请求也在等待的上游请求
+        page_data = await asyncio.shield(
+            self._page_task(query, base_key, page, cache_key)
+        )
+        return page_data, False
+
+    def prefetch(self, query, base_key, page):
+        """在后台预取一页结果，已缓存或正在获取时不做任何事"""
+        if page > self.max_pages:
+            return
+        cache_key = page_cache_key(base_key, page)
+        if cache_key in self._inflight or self.redis_client.exists(cache_key):
+            return
+        logger.info(f"Prefetching search page {page}: {query}")
+        task = self._page_task(query, base_key, page, cache_key)
+        self._background.add(task)
+        task.add_done_callback(self._finish_prefetch)
+
+    def _finish_prefetch(self, task):
+        """记录预取失败，避免未处理的任务异常"""
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error prefetching search page: {task.exception()}")
+
+    async def collect(self, query, base_key, page, offset, limit):
+        """从游标位置开始收集最多limit条结果，返回(结果, 下一页游标, 是否全部来自缓存)"""
+        collected = []
+        all_cached = True
+        while len(collected) < limit:
+            page_data, from_cache = await self.get_page(query, base_key, page)
+            all_cached = all_cached and from_cache
+            if page_data["exhausted"]:
+                # 结果已经取完
+                return collected, None, all_cached
+            results = page_data["results"]
+            taken = results[offset : offset + limit - len(collected)]
+            collected.extend(taken)
+            offset += len(taken)
+            if offset >= len(results):
+                page, offset = page + 1, 0
+
+        # 预取下一次请求需要的页面
+        self.prefetch(query, base_key, page if offset == 0 else page + 1)
+        return collected, encode_cursor(query, page, offset), all_cached
+
+    async def stream(self, query, base_key, page, offset, pages):
+        """逐页产生NDJSON行，当前页输出的同时预取下一页"""
+        for _ in range(pages):
+            try:
+                page_data, from_cache = await self.get_page(query, base_key, page)
+            except Exception as e:
+                logger.error(f"Error fetching search page {page}: {str(e)}")
+                yield json.dumps(
+                    {
+                        "type": "error",
+                        "detail": "Error fetching search results",
+                        "nextCursor": encode_cursor(query, page, offset),
+                    }
+                ) + "\n"
+                return
+            if page_data["exhausted"]:
+                yield json.dumps({"type": "end", "nextCursor": None}) + "\n"
+                return
+            self.prefetch(query, base_key, page + 1)
+            for result in page_data["results"][offset:]:
+                yield json.dumps(
+                    {
+                        "type": "result",
+                        "page": page,
+                        "fromCache": from_cache,
+                        "result": result,
+                    },
+                    ensure_ascii=False,
+                ) + "\n"
+            page, offset = page + 1, 0
+
+        next_cursor = encode_cursor(query, page, 0) if page <= self.max_pages else None
+        yield json.dumps({"type": "end", "nextCursor": next_cursor}) + "\n"
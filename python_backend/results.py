@@ -0,0 +1,326 @@
+import functools
+import json
+import logging
+import re
+from itertools import repeat
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+logger = logging.getLogger("perplexica-redis-cache")
+
+# 规范化URL时移除的跟踪参数；只包含不影响页面内容的参数，
+# ref、spm等在部分网站上会决定显示的内容（例如GitHub的?ref=<分支>），因此保留
+TRACKING_PARAMS = frozenset(
+    (
+        "gclid",
+        "dclid",
+        "fbclid",
+        "msclkid",
+        "yclid",
+        "mc_cid",
+        "mc_eid",
+        "igshid",
+        "ref_src",
+        "_hsenc",
+        "_hsmi",
+    )
+)
+TRACKING_PARAM_PREFIXES = ("utm_",)
+
+# 分词：英文等按单词切分，中日韩文字按单字切分
+_CJK_RANGES = r"\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af"
+_TOKEN_RE = re.compile(rf"[{_CJK_RANGES}]|[^\W_{_CJK_RANGES}]+")
+
+# SimHash计算用到的常量：64位掩码和把"0"/"1"映射为字节0/1的转换表
+_HASH_MASK = 0xFFFFFFFFFFFFFFFF
+_BIT_LANES = str.maketrans("01", "\x00\x01")
+
+# 少于该数量词元的摘要不做近似重复判断，避免短文本误判
+_MIN_SIMHASH_TOKENS = 4
+
+# 累计的投影统计，便于观察缓存节省的字节数
+PROJECTION_TOTALS = {
+    "requests": 0,
+    "upstream_bytes": 0,
+    "projected_bytes": 0,
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _ijson():
+    """按需导入可选依赖ijson，未安装时返回None并回退到整体解析"""
+    try:
+        import ijson
+    except ImportError:  # pragma: no cover
+        return None
+    return ijson
+
+
+def _truncate(value, max_chars):
+    """把值转换为字符串并截断到max_chars个字符"""
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        value = str(value)
+    return value[:max_chars] if max_chars > 0 else value
+
+
+def project_result(item, settings):
+    """把一条SearxNG原始结果投影为精简结构
+
+    URL截断后会变成无效链接，因此超过result_url_max_chars的结果直接丢弃，返回None。
+    """
+    if not isinstance(item, dict):
+        return None
+    url = item.get("url")
+    url = "" if url is None else str(url)
+    if 0 < settings.result_url_max_chars < len(url):
+        return None
+    score = item.get("score")
+    try:
+        score = float(score) if score is not None else 0.0
+    except (TypeError, ValueError):
+        score = 0.0
+    return {
+        "title": _truncate(item.get("title"), settings.result_title_max_chars),
+        "url": url,
+        "content": _truncate(
+            item.get("content") or item.get("snippet"),
+            settings.result_content_max_chars,
+        ),
+        "engine": _truncate(item.get("engine"), 64),
+        "score": score,
+    }
+
+
+def _is_tracking_param(name):
+    """判断查询参数是否为跟踪参数"""
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
+
+
+def canonicalize_url(url):
+    """规范化URL，返回(清理后的URL, 去重键)
+
+    清理后的URL只移除跟踪参数，其余部分（包括片段和参数的原始写法）保持不变；
+    去重键在此基础上进一步忽略协议、`www.`前缀、默认端口、末尾斜杠和查询参数顺序，
+    使不同引擎返回的同一页面得到相同的键。单页应用的路由片段（`#/...`、`#!...`）
+    会保留在键中。URL为空时去重键为None，无法解析时使用原始URL作为去重键。
+    """
+    if not url or not url.strip():
+        return url, None
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url, url
+    if not parts.netloc:
+        return url, url
+
+    # 按原始写法拆分查询参数，避免重新编码改变链接（例如`?foo`变成`?foo=`）
+    params = [param for param in parts.query.split("&") if param]
+    query = [
+        param
+        for param in params
+        if not _is_tracking_param(unquote_plus(param.split("=", 1)[0]))
+    ]
+    cleaned = url
+    if len(query) != len(params):
+        cleaned = urlunsplit(
+            (parts.scheme, parts.netloc, parts.path, "&".join(query), parts.fragment)
+        )
+
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if port not in (None, 80, 443):
+        host = f"{host}:{port}"
+    path = parts.path.rstrip("/") or "/"
+    key = f"{host}{path}"
+    if query:
+        key += "?" + "&".join(sorted(query))
+    if parts.fragment.startswith(("/", "!")):
+        key += "#" + parts.fragment
+    return cleaned, key
+
+
+def simhash(text):
+    """计算文本的64位SimHash指纹，词元过少时返回None
+
+    以相邻两个词元为一个特征。所有特征哈希的位先被展开成一个大整数中的字节通道，
+    再把各段折半相加，用少量大整数运算完成全部位计数，避免逐位或逐特征的Python循环。
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) < _MIN_SIMHASH_TOKENS:
+        return None
+    # 每个字节通道最多计数255，超出部分的特征直接忽略
+    shingles = list(zip(tokens, tokens[1:]))[:255]
+    # 同一请求内比较指纹即可，因此可以直接使用内置hash
+    bits = "".join(
+        map(format, map(_HASH_MASK.__and__, map(hash, shingles)), repeat("064b"))
+    )
+    lanes = int.from_bytes(bits.translate(_BIT_LANES).encode("latin-1"), "big")
+
+    # 每个特征占64字节，把高位的特征段折叠加到低位，直到只剩一段
+    segments = len(shingles)
+    while segments > 1:
+        half = (segments + 1) // 2
+        low_bits = half * 512
+        lanes = (lanes >> low_bits) + (lanes & ((1 << low_bits) - 1))
+        segments = half
+
+    counts = lanes.to_bytes(64, "big")
+    return int(counts.translate(_majority_table(len(shingles))), 2)
+
+
+@functools.lru_cache(maxsize=256)
+def _majority_table(total):
+    """把每一位的计数映射为b"1"（超过半数）或b"0"的转换表"""
+    return bytes(ord("1") if count * 2 > total else ord("0") for count in range(256))
+
+
+def _hamming_distance(a, b):
+    """两个指纹之间的汉明距离"""
+    return bin(a ^ b).count("1")
+
+
+class ResultPipeline:
+    """对投影后的结果分批做URL规范化、去重、近似重复过滤和数量截断
+
+    结果可以来自多个页面或引擎，通过add_batch依次加入；达到limit后不再接受新结果，
+    调用方据此可以提前停止解析上游响应。
+    """
+
+    def __init__(self, settings, limit=None):
+        self.limit = limit
+        self.max_distance = settings.simhash_max_distance
+        self.results = []
+        self.duplicates = 0
+        self.near_duplicates = 0
+        self._seen_keys = set()
+        self._fingerprints = []
+
+    @property
+    def full(self):
+        """是否已经收集到limit条结果"""
+        return self.limit is not None and len(self.results) >= self.limit
+
+    def add_batch(self, batch):
+        """加入一批结果，返回加入后是否已满"""
+        if self.full or not batch:
+            return self.full
+
+        # 先对整批结果统一计算URL和指纹，再逐条过滤
+        canonical = [canonicalize_url(item["url"]) for item in batch]
+        fingerprints = [simhash(item["content"]) for item in batch]
+
+        for item, (cleaned_url, key), fingerprint in zip(
+            batch, canonical, fingerprints
+        ):
+            # 没有URL的结果无法按URL去重，只做近似重复判断
+            if key is not None and key in self._seen_keys:
+                self.duplicates += 1
+                continue
+            if fingerprint is not None and any(
+                _hamming_distance(fingerprint, seen) <= self.max_distance
+                for seen in self._fingerprints
+            ):
+                self.near_duplicates += 1
+                continue
+
+            if key is not None:
+                self._seen_keys.add(key)
+            if fingerprint is not None:
+                self._fingerprints.append(fingerprint)
+            item["url"] = cleaned_url
+            self.results.append(item)
+            if self.full:
+                break
+        return self.full
+
+
+class _AsyncByteReader:
+    """把httpx的字节流包装成ijson可用的异步文件对象，并记录读取量和最大数据块大小"""
+
+    def __init__(self, response):
+        self._chunks = response.aiter_bytes()
+        self.bytes_read = 0
+        self.max_chunk_bytes = 0
+
+    async def read(self, size=-1):
+        if size == 0:
+            # ijson会先用read(0)探测数据类型
+            return b""
+        async for chunk in self._chunks:
+            if chunk:
+                self.bytes_read += len(chunk)
+                self.max_chunk_bytes = max(self.max_chunk_bytes, len(chunk))
+                return chunk
+        return b""
+
+
+async def fetch_projected_results(
+    client, settings, url, params, headers=None, limit=None
+):
+    """请求SearxNG并返回投影、去重后的结果列表和本次请求的字节统计
+
+    安装了ijson时逐块解析`results`数组，完整响应体不会在内存中整体生成，
+    收集到limit条去重后的结果即停止读取；否则回退为读取完整响应体后再投影。
+    """
+    ijson = _ijson()
+    pipeline = ResultPipeline(settings, limit=limit)
+    batch = []
+    async with client.stream("GET", url, params=params, headers=headers) as response:
+        response.raise_for_status()
+        if ijson is not None:
+            reader = _AsyncByteReader(response)
+            try:
+                async for item in ijson.items(
+                    reader, "results.item", use_float=True
+                ):
+                    projected = project_result(item, settings)
+                    if projected is None:
+                        continue
+                    batch.append(projected)
+                    if len(batch) >= settings.result_batch_size:
+                        if pipeline.add_batch(batch):
+                            break
+                        batch = []
+                else:
+                    pipeline.add_batch(batch)
+            except ijson.JSONError as e:
+                # 统一为ValueError，与json.loads的错误类型保持一致
+                raise ValueError(f"Invalid SearxNG response: {e}") from e
+            upstream_bytes = reader.bytes_read
+            max_chunk_bytes = reader.max_chunk_bytes
+        else:
+            body = await response.aread()
+            upstream_bytes = max_chunk_bytes = len(body)
+            raw_results = json.loads(body).get("results")
+            if isinstance(raw_results, list):
+                for item in raw_results:
+                    projected = project_result(item, settings)
+                    if projected is not None:
+                        batch.append(projected)
+            pipeline.add_batch(batch)
+
+    results = pipeline.results
+    projected_bytes = len(json.dumps(results, ensure_ascii=False).encode("utf-8"))
+    stats = {
+        "upstream_bytes": upstream_bytes,
+        "max_chunk_bytes": max_chunk_bytes,
+        "projected_bytes": projected_bytes,
+        "saved_bytes": max(upstream_bytes - projected_bytes, 0),
+        "duplicates": pipeline.duplicates,
+        "near_duplicates": pipeline.near_duplicates,
+    }
+    PROJECTION_TOTALS["requests"] += 1
+    PROJECTION_TOTALS["upstream_bytes"] += upstream_bytes
+    PROJECTION_TOTALS["projected_bytes"] += projected_bytes
+
+    logger.info(
+        f"Projected {len(results)} SearxNG results: upstream {upstream_bytes} bytes, "
+        f"largest chunk {max_chunk_bytes} bytes, cached {projected_bytes} bytes "
+        f"(saved {stats['saved_bytes']} bytes), dropped {pipeline.duplicates} "
+        f"duplicates and {pipeline.near_duplicates} near duplicates"
+    )
+    return results, stats
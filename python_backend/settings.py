@@ -0,0 +1,85 @@
+import functools
+import os
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+
+class Settings(BaseModel):
+    """后端配置，每个字段都可以用同名的大写环境变量覆盖
+
+    配置只在首次调用get_settings()时读取并校验一次，无效的值会让服务在启动时直接失败。
+    """
+
+    # Redis配置
+    redis_host: str = "localhost"
+    redis_port: int = Field(6379, gt=0)
+    redis_db: int = Field(0, ge=0)
+    redis_password: Optional[str] = None
+    redis_max_connections: int = Field(20, gt=0)
+    cache_expiration: int = Field(300, gt=0)  # 5分钟默认过期时间
+
+    # 缓存管理接口的访问令牌，未设置时管理接口返回403
+    cache_admin_token: Optional[str] = None
+
+    # SearxNG配置
+    searxng_api_url: str = "http://localhost:4000"
+    searxng_timeout: float = Field(5.0, gt=0)
+    searxng_max_connections: int = Field(20, gt=0)
+
+    # 结果投影配置：只保留前端和format_message用到的字段，并截断到指定长度；
+    # URL不截断，超过result_url_max_chars的结果直接丢弃
+    result_title_max_chars: int = Field(200, ge=0)
+    result_url_max_chars: int = Field(2048, ge=0)
+    result_content_max_chars: int = Field(500, ge=0)
+
+    # 结果后处理配置：每批处理的结果数量和近似重复判定的SimHash汉明距离阈值
+    # 摘要比网页全文短得多，少量词语差异就会改变较多位，因此阈值比常用的3更宽
+    result_batch_size: int = Field(20, gt=0)
+    simhash_max_distance: int = Field(6, ge=0, le=64)
+
+    # 结果数量配置：SearxNG会忽略limit参数，因此在去重后由后端截断
+    chat_result_limit: int = Field(5, gt=0)
+    search_cache_result_limit: int = Field(50, gt=0)
+    # 分页配置：允许翻到的最大SearxNG页数
+    search_max_pages: int = Field(10, gt=0)
+
+    # 追踪配置：none（默认，仅传播traceparent）、otlp、file或console
+    tracing_exporter: Literal["none", "otlp", "file", "console"] = "none"
+    tracing_file_path: str = "traces.jsonl"
+    tracing_service_name: str = "perplexica-python-backend"
+
+    # 启动配置
+    log_file: Optional[str] = "app.log"
+    prewarm_connections: int = Field(2, ge=0)  # 启动时预先建立的Redis/SearxNG连接数
+    app_reload: bool = False  # 直接运行app.py时是否开启自动重载
+
+    @field_validator(
+        "redis_password", "cache_admin_token", "log_file", mode="before"
+    )
+    @classmethod
+    def _empty_as_none(cls, value):
+        """docker-compose中的空环境变量视为未设置"""
+        return value or None
+
+    @field_validator("tracing_exporter", mode="before")
+    @classmethod
+    def _lower_exporter(cls, value):
+        return value.lower() if isinstance(value, str) else value
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """从环境变量读取配置"""
+        environ = os.environ if environ is None else environ
+        values = {
+            name: environ[name.upper()]
+            for name in cls.model_fields
+            if name.upper() in environ
+        }
+        return cls(**values)
+
+
+@functools.lru_cache(maxsize=None)
+def get_settings():
+    """返回进程内唯一的配置对象"""
+    return Settings.from_env()
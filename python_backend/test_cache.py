@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import requests
+import httpx
 import time
 import logging
 import json
@@ -19,6 +19,9 @@ logger = logging.getLogger("test-redis-cache")
 # 从环境变量中读取API地址
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 
+# 复用同一个HTTP客户端的连接；首次未命中缓存的请求需要等待SearxNG，超时时间放宽
+client = httpx.Client(timeout=30)
+
 
 # 辅助函数：打印分隔线
 def print_separator(title="", char="=", length=80):
@@ -50,20 +53,19 @@ def test_search_cache():
     query = "python redis cache example"
     endpoint = f"{API_URL}/api/search"
 
-    # 计算预期的缓存键
-    expected_cache_key = calculate_cache_key("search", query)
+    # 计算预期的缓存键 - 搜索结果按页缓存
+    expected_cache_key = f"{calculate_cache_key('search', query)}:page:1"
     logger.info(f"预期的缓存键: {expected_cache_key}")
 
     # 第一次请求（预期缓存未命中）
     logger.info(f"📤 发送第一次/api/search搜索请求: {query}")
     start_time = time.time()
-    response = requests.post(endpoint, json={"query": query})
+    response = client.post(endpoint, json={"query": query})
     first_request_time = time.time() - start_time
 
     if response.status_code == 200:
         logger.info(f"⏱️ 第一次请求响应时间: {first_request_time:.4f}秒")
 
-        # 记录SearxNG返回的搜索结果
         search_results = response.json()
         print_separator("第一次请求响应详情", "-")
         logger.info(
@@ -72,41 +74,19 @@ def test_search_cache():
 
         # 打印基本信息
         logger.info(f"🔤 查询: {search_results.get('query')}")
-        logger.info(f"📝 响应: {search_results.get('response')}")
-        logger.info(f"🆔 ID: {search_results.get('id')}")
-
-        # 打印messages信息
-        # 兼容处理：优先检查messages字段，如果不存在则尝试sources字段
-        messages = search_results.get("messages", search_results.get("sources", []))
-        logger.info(f"📚 Messages数量: {len(messages)}")
-
-        if messages:
-            print_separator("Messages详细信息", "-")
-            for i, message in enumerate(messages[:3]):  # 只打印前3个
-                logger.info(f"📄 Message {i+1}:")
-                logger.info(f"  📑 内容: {message.get('pageContent', 'N/A')[:100]}...")
-                metadata = message.get("metadata", {})
-                logger.info(f"  📌 标题: {metadata.get('title', 'N/A')}")
-                logger.info(f"  🔗 URL: {metadata.get('url', 'N/A')}")
-                if i < 2 and i < len(messages) - 1:  # 不是最后一个
-                    logger.info("-" * 40)  # 小分隔线
-
-        # 打印context信息
-        if "context" in search_results:
-            logger.info(f"🔄 上下文: {search_results.get('context')[:50]}...")
-
-        # 打印原始results信息
-        if "results" in search_results:
-            results = search_results.get("results", [])
-            print_separator("原始搜索结果", "-")
-            logger.info(f"🔢 原始结果数量: {len(results)}")
-            for i, result in enumerate(results[:3]):  # 只打印前3个
-                logger.info(f"🔍 结果 {i+1}: {result.get('title', 'N/A')}")
-                logger.info(f"  🔗 URL: {result.get('url', 'N/A')}")
-                if "content" in result:
-                    logger.info(f"  📑 内容: {result.get('content', 'N/A')[:100]}...")
-                if i < 2 and i < len(results) - 1:  # 不是最后一个
-                    logger.info("-" * 40)  # 小分隔线
+        logger.info(f"📄 页码: {search_results.get('page')}")
+        logger.info(f"➡️ 下一页游标: {search_results.get('nextCursor')}")
+
+        results = search_results.get("results", [])
+        logger.info(f"🔢 结果数量: {len(results)}")
+        if not results:
+            logger.warning("⚠️ 没有返回任何结果，无法验证缓存内容")
+        for i, result in enumerate(results[:3]):  # 只打印前3个
+            logger.info(f"🔍 结果 {i+1}: {result.get('title', 'N/A')}")
+            logger.info(f"  🔗 URL: {result.get('url', 'N/A')}")
+            logger.info(f"  📑 内容: {result.get('content', 'N/A')[:100]}...")
+            if i < 2 and i < len(results) - 1:  # 不是最后一个
+                logger.info("-" * 40)  # 小分隔线
 
         # 等待一下，确保请求完全处理
         time.sleep(1)
@@ -115,7 +95,7 @@ def test_search_cache():
         print_separator("第二次搜索请求", "-")
         logger.info(f"📤 发送第二次相同/api/search搜索请求: {query}")
         start_time = time.time()
-        response = requests.post(endpoint, json={"query": query})
+        response = client.post(endpoint, json={"query": query})
         second_request_time = time.time() - start_time
 
         if response.status_code == 200:
@@ -126,21 +106,23 @@ def test_search_cache():
 
             # 验证第二次请求是否命中缓存
             second_results = response.json()
-            logger.info(
-                f"🔍 第二次请求缓存状态: {'✅ 命中' if second_results.get('fromCache') else '❌ 未命中'}"
-            )
+            if second_results.get("fromCache"):
+                logger.info("🔍 第二次请求缓存状态: ✅ 命中")
+            else:
+                logger.warning("⚠️ 第二次请求未命中缓存")
 
-            # 验证messages是否一致
-            second_messages = second_results.get(
-                "messages", second_results.get("sources", [])
-            )
-            logger.info(f"📚 第二次请求Messages数量: {len(second_messages)}")
-            if len(messages) == len(second_messages):
-                logger.info("✅ 两次请求返回的messages数量一致")
+            # 验证两次请求返回的结果和游标是否一致
+            second_urls = [r.get("url") for r in second_results.get("results", [])]
+            if results and second_urls == [r.get("url") for r in results]:
+                logger.info("✅ 两次请求返回的结果一致")
             else:
                 logger.warning(
-                    f"⚠️ 两次请求返回的messages数量不一致: {len(messages)} vs {len(second_messages)}"
+                    f"⚠️ 两次请求返回的结果不一致: {len(results)} vs {len(second_urls)}"
                 )
+            if second_results.get("nextCursor") == search_results.get("nextCursor"):
+                logger.info("✅ 两次请求返回的nextCursor一致")
+            else:
+                logger.warning("⚠️ 两次请求返回的nextCursor不一致")
         else:
             logger.error(f"❌ 第二次请求失败: {response.status_code} - {response.text}")
     else:
@@ -149,6 +131,120 @@ def test_search_cache():
     print_separator("搜索API缓存测试结束")
 
 
+def test_search_pagination():
+    """测试搜索API的游标翻页"""
+    print_separator("搜索API游标翻页测试开始")
+    query = "python redis cache example"
+    endpoint = f"{API_URL}/api/search"
+
+    # 依次翻页，验证每页结果不重复且游标可以往返使用
+    cursor = None
+    seen_urls = set()
+    for page_number in range(1, 4):
+        response = client.post(
+            endpoint, json={"query": query, "limit": 5, "cursor": cursor}
+        )
+        if response.status_code != 200:
+            logger.error(
+                f"❌ 第{page_number}次翻页失败: {response.status_code} - {response.text}"
+            )
+            break
+        data = response.json()
+        urls = [r.get("url") for r in data.get("results", [])]
+        logger.info(
+            f"📄 第{page_number}次翻页: {len(urls)} 条结果, "
+            f"缓存: {'✅ 命中' if data.get('fromCache') else '❌ 未命中'}"
+        )
+        repeated = seen_urls.intersection(urls)
+        if repeated:
+            logger.warning(f"⚠️ 翻页返回了重复的结果: {repeated}")
+        else:
+            logger.info("✅ 本页结果与之前的结果没有重复")
+        seen_urls.update(urls)
+
+        next_cursor = data.get("nextCursor")
+        if next_cursor is None:
+            logger.info("🔚 结果已经取完")
+            break
+        if next_cursor == cursor:
+            logger.warning("⚠️ nextCursor没有前进")
+            break
+        cursor = next_cursor
+
+    # 用同一个游标再次请求应该得到相同的结果
+    if cursor:
+        payload = {"query": query, "limit": 5, "cursor": cursor}
+        first = client.post(endpoint, json=payload)
+        second = client.post(endpoint, json=payload)
+        if (
+            first.status_code == 200
+            and first.json().get("results") == second.json().get("results")
+        ):
+            logger.info("✅ 同一游标两次请求返回的结果一致")
+        else:
+            logger.warning("⚠️ 同一游标两次请求返回的结果不一致")
+
+    # 属于其他查询的游标和无效的参数应该被拒绝
+    if cursor:
+        response = client.post(
+            endpoint, json={"query": query + " other", "cursor": cursor}
+        )
+        if response.status_code == 400:
+            logger.info("✅ 其他查询的游标被拒绝 (400)")
+        else:
+            logger.warning(f"⚠️ 其他查询的游标未被拒绝: {response.status_code}")
+    for invalid in ({"cursor": "not-a-cursor"}, {"limit": 0}, {"limit": -3}):
+        response = client.post(endpoint, json={"query": query, **invalid})
+        if response.status_code in (400, 422):
+            logger.info(f"✅ 无效参数 {invalid} 被拒绝 ({response.status_code})")
+        else:
+            logger.warning(f"⚠️ 无效参数 {invalid} 未被拒绝: {response.status_code}")
+
+    print_separator("搜索API游标翻页测试结束")
+
+
+def test_search_stream():
+    """测试流式搜索API"""
+    print_separator("流式搜索API测试开始")
+    query = "python redis cache example"
+    endpoint = f"{API_URL}/api/search/stream"
+
+    logger.info(f"📤 发送/api/search/stream请求: {query}")
+    lines = []
+    with client.stream("POST", endpoint, json={"query": query, "pages": 2}) as response:
+        if response.status_code != 200:
+            response.read()
+            logger.error(f"❌ 流式请求失败: {response.status_code} - {response.text}")
+            print_separator("流式搜索API测试结束")
+            return
+        logger.info(f"📦 Content-Type: {response.headers.get('content-type')}")
+        for line in response.iter_lines():
+            if line:
+                lines.append(json.loads(line))
+
+    results = [line for line in lines if line.get("type") == "result"]
+    pages = sorted({line.get("page") for line in results})
+    logger.info(f"🔢 收到 {len(lines)} 行, 其中 {len(results)} 条结果, 页码: {pages}")
+    if lines and lines[-1].get("type") == "end":
+        logger.info(f"✅ 以end行结束, nextCursor: {lines[-1].get('nextCursor')}")
+    elif lines and lines[-1].get("type") == "error":
+        logger.warning(f"⚠️ 流式请求中途失败: {lines[-1].get('detail')}")
+    else:
+        logger.warning("⚠️ 流式响应没有以end行结束")
+
+    # 流式结果的第一页应与/api/search返回的第一页一致（两者共享同一页缓存）
+    response = client.post(f"{API_URL}/api/search", json={"query": query})
+    if response.status_code == 200:
+        search_urls = [r.get("url") for r in response.json().get("results", [])]
+        stream_urls = [line["result"].get("url") for line in results]
+        if search_urls and stream_urls[: len(search_urls)] == search_urls:
+            logger.info("✅ 流式结果与/api/search的结果一致")
+        else:
+            logger.warning("⚠️ 流式结果与/api/search的结果不一致")
+
+    print_separator("流式搜索API测试结束")
+
+
 def test_chat_cache():
     """测试聊天API的缓存效果"""
     print_separator("聊天API缓存测试开始")
@@ -163,7 +259,7 @@ def test_chat_cache():
     # 第一次请求（预期缓存未命中）
     logger.info(f"📤 发送第一次/api/chat聊天请求: {query}")
     start_time = time.time()
-    response = requests.post(endpoint, json={"query": query, "context": context})
+    response = client.post(endpoint, json={"query": query, "context": context})
     first_request_time = time.time() - start_time
 
     if response.status_code == 200:
@@ -206,7 +302,7 @@ def test_chat_cache():
         print_separator("第二次聊天请求", "-")
         logger.info(f"📤 发送第二次相同/api/chat聊天请求: {query}")
         start_time = time.time()
-        response = requests.post(endpoint, json={"query": query, "context": context})
+        response = client.post(endpoint, json={"query": query, "context": context})
         second_request_time = time.time() - start_time
 
         if response.status_code == 200:
@@ -274,7 +370,7 @@ def test_chat_with_searxng_context():
     logger.info(f"预期的缓存键: {expected_cache_key}")
 
     logger.info(f"📤 发送带有SearxNG context的聊天请求: {query}")
-    response = requests.post(endpoint, json={"query": query, "context": context})
+    response = client.post(endpoint, json={"query": query, "context": context})
 
     if response.status_code == 200:
         chat_result = response.json()
@@ -317,7 +413,7 @@ def test_health():
     logger.info("🔍 检查API健康状态")
 
     try:
-        response = requests.get(endpoint)
+        response = client.get(endpoint)
         if response.status_code == 200:
             health_data = response.json()
             logger.info(f"✅ API状态: healthy")
@@ -356,7 +452,7 @@ def test_save_chat_response():
     logger.info(f"预期的缓存键: {expected_cache_key}")
 
     logger.info(f"📤 发送保存聊天响应请求: {query}")
-    response = requests.post(
+    response = client.post(
         endpoint,
         json={
             "query": query,
@@ -377,7 +473,7 @@ def test_save_chat_response():
         logger.info("🔍 验证缓存是否生效...")
         time.sleep(1)  # 等待缓存写入完成
 
-        verify_response = requests.post(endpoint, json={"query": query})
+        verify_response = client.post(endpoint, json={"query": query})
 
         if verify_response.status_code == 200:
             verify_result = verify_response.json()
@@ -392,7 +488,7 @@ def test_save_chat_response():
             # 故意用稍有不同的查询再次尝试，测试缓存是否采取了宽松的匹配策略
             logger.info("🔍 使用稍有不同的查询验证缓存机制的健壮性...")
             slightly_different_query = query + "  "  # 添加额外空格
-            second_verify_response = requests.post(
+            second_verify_response = client.post(
                 endpoint, json={"query": slightly_different_query}
             )
 
@@ -421,6 +517,12 @@ if __name__ == "__main__":
     # 测试搜索缓存
     test_search_cache()
 
+    # 测试游标翻页
+    test_search_pagination()
+
+    # 测试流式搜索
+    test_search_stream()
+
     # 测试聊天缓存
     test_chat_cache()
 
@@ -0,0 +1,165 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cache_admin
+from app import create_app
+from cache_admin import (
+    CACHE_HITS_KEY,
+    cache_stats,
+    invalidate_key,
+    invalidate_prefix,
+    prune_index,
+    record_cache_hit,
+    write_cache,
+)
+from settings import Settings
+
+fakeredis = pytest.importorskip("fakeredis")
+
+CHAT_INDEX = cache_admin.CACHE_INDEX_KEY.format(model_type="chat")
+SEARCH_INDEX = cache_admin.CACHE_INDEX_KEY.format(model_type="search")
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def write(redis_client, key, expiration=300):
+    write_cache(redis_client, key, "{}", expiration)
+
+
+def test_write_cache_sets_value_ttl_and_expiry_score(redis_client):
+    before = time.time()
+    write(redis_client, "chat:a", 300)
+    assert redis_client.get("chat:a") == "{}"
+    assert 0 < redis_client.ttl("chat:a") <= 300
+    assert redis_client.zscore(CHAT_INDEX, "chat:a") >= before + 300
+
+
+def test_write_cache_skips_index_for_unknown_prefix(redis_client):
+    write(redis_client, "other:a")
+    assert redis_client.get("other:a") == "{}"
+    assert redis_client.keys("cache:*") == []
+
+
+def test_hit_does_not_extend_index_expiry(redis_client):
+    write(redis_client, "chat:a", 300)
+    expires_at = redis_client.zscore(CHAT_INDEX, "chat:a")
+    record_cache_hit(redis_client, "chat:a")
+    assert redis_client.zscore(CHAT_INDEX, "chat:a") == expires_at
+    assert redis_client.zscore(CACHE_HITS_KEY, "chat:a") == 1
+
+
+def test_write_prunes_expired_index_entries(redis_client):
+    write(redis_client, "chat:old", 300)
+    # 模拟已经过期的索引项
+    redis_client.zadd(CHAT_INDEX, {"chat:old": time.time() - 1})
+    write(redis_client, "chat:new", 300)
+    assert redis_client.zrange(CHAT_INDEX, 0, -1) == ["chat:new"]
+
+
+def test_prune_index_removes_expired_hits(redis_client):
+    write(redis_client, "chat:old")
+    write(redis_client, "search:q:page:1")
+    record_cache_hit(redis_client, "chat:old")
+    record_cache_hit(redis_client, "search:q:page:1")
+    redis_client.zadd(CHAT_INDEX, {"chat:old": time.time() - 1})
+
+    assert prune_index(redis_client) == 1
+    assert redis_client.zrange(CACHE_HITS_KEY, 0, -1, withscores=True) == [
+        ("search:q:page:1", 1.0)
+    ]
+    assert not redis_client.exists(cache_admin.CACHE_LIVE_KEY)
+
+
+def test_hits_are_capped(redis_client, monkeypatch):
+    monkeypatch.setattr(cache_admin, "CACHE_HITS_MAX_KEYS", 2)
+    for key, hits in (("chat:a", 3), ("chat:b", 2), ("chat:c", 1)):
+        for _ in range(hits):
+            record_cache_hit(redis_client, key)
+    assert redis_client.zrange(CACHE_HITS_KEY, 0, -1) == ["chat:b", "chat:a"]
+
+
+def test_invalidate_prefix_removes_keys_and_index_entries(redis_client):
+    write(redis_client, "search:q:page:1")
+    write(redis_client, "search:q:page:2")
+    write(redis_client, "search:other:page:1")
+    record_cache_hit(redis_client, "search:q:page:1")
+
+    assert invalidate_prefix(redis_client, "search:q:page:") == 2
+    assert redis_client.keys("search:q:*") == []
+    assert redis_client.zrange(SEARCH_INDEX, 0, -1) == ["search:other:page:1"]
+    assert redis_client.zscore(CACHE_HITS_KEY, "search:q:page:1") is None
+
+
+def test_invalidate_prefix_escapes_glob_characters(redis_client):
+    write(redis_client, "chat:a*")
+    write(redis_client, "chat:ab")
+    assert invalidate_prefix(redis_client, "chat:a*") == 1
+    assert redis_client.exists("chat:ab")
+
+
+def test_invalidate_prefix_rejects_unknown_prefix(redis_client):
+    with pytest.raises(ValueError):
+        invalidate_prefix(redis_client, "")
+    with pytest.raises(ValueError):
+        invalidate_prefix(redis_client, "cache:")
+
+
+def test_invalidate_key(redis_client):
+    write(redis_client, "chat:a")
+    assert invalidate_key(redis_client, "chat:a") == 1
+    assert invalidate_key(redis_client, "chat:a") == 0
+    assert redis_client.zcard(CHAT_INDEX) == 0
+
+
+def test_cache_stats_counts_live_keys_and_hot_keys(redis_client):
+    write(redis_client, "chat:a")
+    write(redis_client, "search:q:page:1")
+    redis_client.zadd(CHAT_INDEX, {"chat:expired": time.time() - 1})
+    record_cache_hit(redis_client, "chat:a")
+    record_cache_hit(redis_client, "chat:a")
+
+    stats = cache_stats(redis_client)
+    assert stats["keyCounts"] == {"search": 1, "chat": 1}
+    assert stats["prunedIndexEntries"] == 1
+    assert stats["hotKeys"] == [{"key": "chat:a", "hits": 2}]
+
+
+@pytest.mark.parametrize(
+    "token, headers, status",
+    [
+        (None, {}, 403),
+        (None, {"X-Admin-Token": ""}, 403),
+        ("secret", {}, 401),
+        ("secret", {"X-Admin-Token": "wrong"}, 401),
+        ("secret", {"X-Admin-Token": "secret"}, 200),
+    ],
+)
+def test_admin_endpoints_require_configured_token(redis_client, token, headers, status):
+    app = create_app(
+        Settings(cache_admin_token=token, prewarm_connections=0, log_file=None)
+    )
+    with TestClient(app) as client:
+        app.state.redis = redis_client
+        response = client.post(
+            "/api/cache/invalidate", json={"prefix": "search:"}, headers=headers
+        )
+        assert response.status_code == status
+        assert client.get("/api/cache/stats", headers=headers).status_code == status
+
+
+@pytest.mark.parametrize("query", ["top=0", "top=101", "sample=0", "sample=201"])
+def test_cache_stats_rejects_out_of_range_params(redis_client, query):
+    app = create_app(
+        Settings(cache_admin_token="secret", prewarm_connections=0, log_file=None)
+    )
+    with TestClient(app) as client:
+        app.state.redis = redis_client
+        response = client.get(
+            f"/api/cache/stats?{query}", headers={"X-Admin-Token": "secret"}
+        )
+        assert response.status_code == 422
@@ -0,0 +1,282 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from pagination import SearchPager, decode_cursor, encode_cursor, page_cache_key
+
+fakeredis = pytest.importorskip("fakeredis")
+
+BASE_KEY = "search:q"
+PAGE_SIZE = 3
+
+
+class FakeSearxng:
+    """按页返回固定结果并记录每页的请求次数，最后一页之后返回空列表"""
+
+    def __init__(self, pages=3, delay=0.01):
+        self.pages = pages
+        self.delay = delay
+        self.calls = {}
+
+    async def fetch_page(self, query, page):
+        self.calls[page] = self.calls.get(page, 0) + 1
+        await asyncio.sleep(self.delay)
+        if page > self.pages:
+            return []
+        return [{"url": f"https://example.com/{page}/{i}"} for i in range(PAGE_SIZE)]
+
+
+def make_pager(searxng, max_pages=10):
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    return SearchPager(redis_client, searxng.fetch_page, 300, max_pages)
+
+
+def urls(results):
+    return [result["url"] for result in results]
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("Redis Cache", 3, 2)
+    assert decode_cursor(cursor, "  redis cache ") == (3, 2)
+    assert decode_cursor(None, "redis cache") == (1, 0)
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-a-cursor",
+        encode_cursor("q", 0, 0),
+        raw_cursor('{"q":"q","p":1e999,"o":0}'),
+        raw_cursor('{"q":"q","p":1,"o":-1e999}'),
+        raw_cursor('{"q":"q","p":"x","o":0}'),
+        raw_cursor('["q",1,0]'),
+    ],
+)
+def test_decode_cursor_rejects_invalid_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "q")
+
+
+def test_decode_cursor_rejects_other_query():
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor("q", 1, 0), "other")
+
+
+def test_concurrent_requests_share_one_upstream_fetch():
+    searxng = FakeSearxng()
+    pager = make_pager(searxng)
+
+    async def run():
+        return await asyncio.gather(
+            *(pager.get_page("q", BASE_KEY, 1) for _ in range(5))
+        )
+
+    pages = asyncio.run(run())
+    assert searxng.calls == {1: 1}
+    assert all(results == pages[0][0] for results, _ in pages)
+    # 第二次读取来自缓存
+    assert asyncio.run(pager.get_page("q", BASE_KEY, 1))[1] is True
+    assert searxng.calls == {1: 1}
+
+
+def test_collect_follows_cursor_and_prefetches_next_page():
+    searxng = FakeSearxng()
+    pager = make_pager(searxng)
+
+    async def run():
+        seen = []
+        page, offset = 1, 0
+        while True:
+            results, cursor, _ = await pager.collect("q", BASE_KEY, page, offset, 2)
+            seen.extend(urls(results))
+            if cursor is None:
+                return seen
+            assert decode_cursor(cursor, "q") != (page, offset)
+            page, offset = decode_cursor(cursor, "q")
+            # 等待后台预取完成
+            await asyncio.sleep(0.05)
+
+    seen = asyncio.run(run())
+    assert len(seen) == len(set(seen)) == 3 * PAGE_SIZE
+    # 预取和翻页共享请求，每页只请求一次
+    assert set(searxng.calls.values()) == {1}
+
+
+def test_collect_stops_at_max_pages():
+    searxng = FakeSearxng(pages=10)
+    pager = make_pager(searxng, max_pages=2)
+    results, cursor, _ = asyncio.run(pager.collect("q", BASE_KEY, 1, 0, 100))
+    assert len(results) == 2 * PAGE_SIZE
+    assert cursor is None
+    assert 3 not in searxng.calls
+
+
+def test_corrupted_page_cache_is_refetched():
+    searxng = FakeSearxng()
+    pager = make_pager(searxng)
+    pager.redis_client.set(page_cache_key(BASE_KEY, 1), "not json")
+    page_data, from_cache = asyncio.run(pager.get_page("q", BASE_KEY, 1))
+    assert not from_cache
+    assert len(page_data["results"]) == PAGE_SIZE
+    assert searxng.calls == {1: 1}
+
+
+def test_page_cache_without_keys_is_refetched():
+    searxng = FakeSearxng()
+    pager = make_pager(searxng)
+    pager.redis_client.set(
+        page_cache_key(BASE_KEY, 1), json.dumps({"query": "q", "results": []})
+    )
+    page_data, from_cache = asyncio.run(pager.get_page("q", BASE_KEY, 1))
+    assert not from_cache
+    assert len(page_data["keys"]) == PAGE_SIZE
+
+
+class OverlappingSearxng(FakeSearxng):
+    """相邻页面共享一半结果的上游：第p页返回第3(p-1)到3(p-1)+5条"""
+
+    async def fetch_page(self, query, page):
+        self.calls[page] = self.calls.get(page, 0) + 1
+        if page > self.pages:
+            return []
+        start = 3 * (page - 1)
+        return [{"url": f"https://example.com/{i}"} for i in range(start, start + 6)]
+
+
+def test_collect_removes_results_repeated_across_pages():
+    searxng = OverlappingSearxng(pages=5)
+    pager = make_pager(searxng)
+
+    async def run():
+        seen = []
+        cursor = None
+        for _ in range(3):
+            page, offset = decode_cursor(cursor, "q")
+            results, cursor, _ = await pager.collect("q", BASE_KEY, page, offset, 6)
+            seen.extend(urls(results))
+        return seen
+
+    seen = asyncio.run(run())
+    assert seen == [f"https://example.com/{i}" for i in range(18)]
+    assert set(searxng.calls.values()) == {1}
+
+
+def test_stream_removes_results_repeated_across_pages():
+    searxng = OverlappingSearxng(pages=3)
+    pager = make_pager(searxng)
+
+    async def run():
+        return [
+            json.loads(line)
+            async for line in pager.stream("q", BASE_KEY, 1, 0, pages=5)
+        ]
+
+    lines = asyncio.run(run())
+    results = [line["result"]["url"] for line in lines if line["type"] == "result"]
+    assert results == [f"https://example.com/{i}" for i in range(12)]
+    assert lines[-1] == {"type": "end", "nextCursor": None}
+
+
+def test_page_of_only_duplicates_does_not_end_pagination():
+    class RepeatingSearxng(FakeSearxng):
+        async def fetch_page(self, query, page):
+            # 第2页与第1页完全相同，第3页才有新结果
+            page = 1 if page == 2 else page
+            return await super().fetch_page(query, page)
+
+    pager = make_pager(RepeatingSearxng())
+    results, cursor, _ = asyncio.run(pager.collect("q", BASE_KEY, 1, 0, 2 * PAGE_SIZE))
+    assert urls(results) == [
+        f"https://example.com/{page}/{i}" for page in (1, 3) for i in range(PAGE_SIZE)
+    ]
+    assert cursor is not None
+
+
+def test_fetching_a_later_page_first_fills_earlier_pages():
+    searxng = OverlappingSearxng(pages=5)
+    pager = make_pager(searxng)
+    page_data, _ = asyncio.run(pager.get_page("q", BASE_KEY, 3))
+    assert urls(page_data["results"]) == [
+        f"https://example.com/{i}" for i in range(9, 12)
+    ]
+    assert searxng.calls == {1: 1, 2: 1, 3: 1}
+
+
+def test_stream_yields_pages_and_end_cursor():
+    searxng = FakeSearxng()
+    pager = make_pager(searxng)
+
+    async def run():
+        return [
+            json.loads(line)
+            async for line in pager.stream("q", BASE_KEY, 1, 1, pages=2)
+        ]
+
+    lines = asyncio.run(run())
+    results = [line for line in lines if line["type"] == "result"]
+    assert [line["page"] for line in results] == [1, 1, 2, 2, 2]
+    assert lines[-1] == {"type": "end", "nextCursor": encode_cursor("q", 3, 0)}
+
+
+def test_stream_reports_upstream_errors():
+    async def failing_fetch(query, page):
+        raise ValueError("bad response")
+
+    pager = SearchPager(
+        fakeredis.FakeRedis(decode_responses=True), failing_fetch, 300, 10
+    )
+
+    async def run():
+        return [
+            json.loads(line)
+            async for line in pager.stream("q", BASE_KEY, 1, 0, pages=1)
+        ]
+
+    lines = asyncio.run(run())
+    assert lines == [
+        {
+            "type": "error",
+            "detail": "Error fetching search results",
+            "nextCursor": encode_cursor("q", 1, 0),
+        }
+    ]
+
+
+@pytest.mark.parametrize(
+    "path, body",
+    [
+        ("/api/search", {"query": "q", "limit": 0}),
+        ("/api/search", {"query": "q", "limit": -3}),
+        ("/api/search/stream", {"query": "q", "pages": 0}),
+        ("/api/search/stream", {"query": "q", "pages": 1000}),
+    ],
+)
+def test_search_rejects_out_of_range_limit_and_pages(path, body):
+    from fastapi.testclient import TestClient
+
+    from app import create_app
+    from settings import Settings
+
+    app = create_app(Settings(prewarm_connections=0, log_file=None))
+    with TestClient(app) as client:
+        assert client.post(path, json=body).status_code == 422
+
+
+def test_search_rejects_overflowing_cursor():
+    from fastapi.testclient import TestClient
+
+    from app import create_app
+    from settings import Settings
+
+    app = create_app(Settings(prewarm_connections=0, log_file=None))
+    cursor = raw_cursor('{"q":"q","p":1e999,"o":0}')
+    with TestClient(app) as client:
+        for path in ("/api/search", "/api/search/stream"):
+            response = client.post(path, json={"query": "q", "cursor": cursor})
+            assert response.status_code == 400
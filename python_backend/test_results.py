@@ -0,0 +1,181 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from results import (
+    ResultPipeline,
+    canonicalize_url,
+    fetch_projected_results,
+    project_result,
+    simhash,
+)
+from settings import Settings
+
+SETTINGS = Settings()
+
+
+def make_result(url, content):
+    return {"title": "t", "url": url, "content": content, "engine": "e", "score": 0.0}
+
+
+def fetch(body, settings=SETTINGS, limit=None):
+    """用模拟的SearxNG响应调用fetch_projected_results"""
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await fetch_projected_results(
+                client, settings, "http://searxng/search", params={}, limit=limit
+            )
+
+    return asyncio.run(run())
+
+
+def test_project_result_keeps_only_needed_fields():
+    item = dict(make_result("https://a.com/", "text"), engines=["e"], positions=[1])
+    assert project_result(item, SETTINGS) == make_result("https://a.com/", "text")
+    assert project_result("not a dict", SETTINGS) is None
+
+
+def test_project_result_drops_over_long_urls():
+    settings = Settings(result_url_max_chars=20)
+    long_url = "https://a.com/" + "x" * 20
+    assert project_result(make_result(long_url, ""), settings) is None
+    assert project_result(make_result("https://a.com/", ""), settings)["url"] == (
+        "https://a.com/"
+    )
+
+
+def test_project_result_truncates_content():
+    settings = Settings(result_content_max_chars=10)
+    projected = project_result(make_result("https://a.com/", "x" * 50), settings)
+    assert projected["content"] == "x" * 10
+
+
+def test_fetch_projected_results_projects_and_reports_bytes():
+    raw = [
+        dict(make_result(f"https://a.com/{i}", f"snippet {i}"), engines=["e"] * 50)
+        for i in range(3)
+    ]
+    body = json.dumps({"query": "q", "results": raw}).encode("utf-8")
+    results, stats = fetch(body)
+    assert results == [
+        make_result(f"https://a.com/{i}", f"snippet {i}") for i in range(3)
+    ]
+    assert stats["upstream_bytes"] == len(body)
+    assert 0 < stats["projected_bytes"] < stats["upstream_bytes"]
+    assert stats["max_chunk_bytes"] <= stats["upstream_bytes"]
+
+
+def test_fetch_projected_results_stops_at_limit():
+    body = json.dumps(
+        {"results": [make_result(f"https://a.com/{i}", str(i)) for i in range(100)]}
+    ).encode("utf-8")
+    results, _ = fetch(body, settings=Settings(result_batch_size=5), limit=3)
+    assert [r["url"] for r in results] == [f"https://a.com/{i}" for i in range(3)]
+
+
+def test_fetch_projected_results_rejects_invalid_json():
+    with pytest.raises(ValueError):
+        fetch(b'{"results": [{"title": ')
+
+
+def test_canonicalize_url_ignores_scheme_www_and_trailing_slash():
+    _, key_a = canonicalize_url("https://www.example.com/articles/1/")
+    _, key_b = canonicalize_url("http://example.com/articles/1")
+    assert key_a == key_b
+
+
+def test_canonicalize_url_removes_only_tracking_params():
+    cleaned, key = canonicalize_url(
+        "https://example.com/p?utm_source=x&b=2&fbclid=y&a=1#section"
+    )
+    assert cleaned == "https://example.com/p?b=2&a=1#section"
+    assert key == "example.com/p?a=1&b=2"
+
+
+def test_canonicalize_url_keeps_original_url_untouched():
+    for url in (
+        "https://a.com/?foo",
+        "https://a.com/#/route/1",
+        "https://a.com/x%20y",
+        "https://github.com/org/repo/blob/main/README.md?ref=v2",
+        "https://item.example.cn/1.html?spm=a1z10",
+    ):
+        assert canonicalize_url(url)[0] == url
+
+
+def test_canonicalize_url_keeps_spa_fragments_in_key():
+    _, key_a = canonicalize_url("https://a.com/#/route/1")
+    _, key_b = canonicalize_url("https://a.com/#!/route/2")
+    _, key_c = canonicalize_url("https://a.com/#section")
+    assert key_a != key_b
+    assert key_c == "a.com/"
+
+
+def test_canonicalize_url_falls_back_on_invalid_port():
+    url = "http://example.com:abc/x"
+    assert canonicalize_url(url) == (url, url)
+
+
+def test_canonicalize_url_has_no_key_for_empty_url():
+    assert canonicalize_url("") == ("", None)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def test_simhash_ignores_case_and_punctuation():
+    assert simhash("too short") is None
+    assert simhash("Redis is an in-memory data store.") == simhash(
+        "redis is an in memory data store"
+    )
+
+
+def test_simhash_is_close_for_near_duplicates():
+    # 内置hash每个进程的种子不同，因此只比较相对距离，阈值留有足够余量
+    words = [f"word{i}" for i in range(200)]
+    text = " ".join(words)
+    near = " ".join(words[:100] + ["changed"] + words[101:])
+    other = " ".join(f"other{i}" for i in range(200))
+    assert hamming(simhash(text), simhash(near)) <= 16
+    assert hamming(simhash(text), simhash(other)) > SETTINGS.simhash_max_distance
+
+
+def test_pipeline_removes_url_and_near_duplicates():
+    content = "redis is an in memory data store used as a cache and message broker"
+    pipeline = ResultPipeline(SETTINGS)
+    pipeline.add_batch(
+        [
+            make_result("https://example.com/a?utm_source=x", content),
+            make_result("https://www.example.com/a/", "different words entirely here"),
+            make_result("https://mirror.example.org/a", content.title() + "."),
+            make_result("https://example.com/b", "a completely unrelated snippet text"),
+        ]
+    )
+    assert [r["url"] for r in pipeline.results] == [
+        "https://example.com/a",
+        "https://example.com/b",
+    ]
+    assert pipeline.duplicates == 1
+    assert pipeline.near_duplicates == 1
+
+
+def test_pipeline_keeps_results_without_url():
+    pipeline = ResultPipeline(SETTINGS)
+    pipeline.add_batch([make_result("", "first"), make_result("", "second")])
+    assert len(pipeline.results) == 2
+
+
+def test_pipeline_stops_at_limit():
+    pipeline = ResultPipeline(SETTINGS, limit=2)
+    full = pipeline.add_batch(
+        [make_result(f"https://example.com/{i}", str(i)) for i in range(5)]
+    )
+    assert full
+    assert len(pipeline.results) == 2
+    assert pipeline.add_batch([make_result("https://example.com/6", "6")])
+    assert len(pipeline.results) == 2
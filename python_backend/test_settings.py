@@ -0,0 +1,92 @@
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from app import create_app
+from settings import Settings
+
+
+@pytest.mark.parametrize(
+    "environ",
+    [
+        {"REDIS_PORT": "not-a-port"},
+        {"REDIS_PORT": "0"},
+        {"CACHE_EXPIRATION": "-1"},
+        {"SEARXNG_TIMEOUT": "0"},
+        {"SIMHASH_MAX_DISTANCE": "65"},
+        {"TRACING_EXPORTER": "jaeger"},
+        {"APP_RELOAD": "maybe"},
+    ],
+)
+def test_from_env_rejects_invalid_values(environ):
+    with pytest.raises(ValidationError):
+        Settings.from_env(environ)
+
+
+def test_from_env_reads_uppercase_variables():
+    settings = Settings.from_env(
+        {
+            "REDIS_HOST": "redis",
+            "REDIS_PORT": "6380",
+            "SEARXNG_TIMEOUT": "2.5",
+            "TRACING_EXPORTER": "OTLP",
+            "APP_RELOAD": "true",
+            "redis_db": "3",  # 只识别大写的环境变量
+        }
+    )
+    assert settings.redis_host == "redis"
+    assert settings.redis_port == 6380
+    assert settings.searxng_timeout == 2.5
+    assert settings.tracing_exporter == "otlp"
+    assert settings.app_reload is True
+    assert settings.redis_db == 0
+
+
+def test_from_env_treats_empty_values_as_unset():
+    settings = Settings.from_env(
+        {"REDIS_PASSWORD": "", "CACHE_ADMIN_TOKEN": "", "LOG_FILE": ""}
+    )
+    assert settings.redis_password is None
+    assert settings.cache_admin_token is None
+    assert settings.log_file is None
+
+
+def test_lifespan_builds_and_closes_clients(monkeypatch):
+    import redis
+
+    closed = []
+    monkeypatch.setattr(redis.Redis, "close", lambda self: closed.append(self))
+
+    settings = Settings(
+        redis_max_connections=7,
+        searxng_max_connections=3,
+        prewarm_connections=0,
+        log_file=None,
+    )
+    app = create_app(settings)
+    with TestClient(app):
+        state = app.state
+        assert state.settings is settings
+        assert state.redis.connection_pool.max_connections == 7
+        assert not state.http_client.is_closed
+        assert state.search_pager.redis_client is state.redis
+        assert state.search_pager.max_pages == settings.search_max_pages
+
+    assert state.http_client.is_closed
+    assert closed == [state.redis]
+
+
+def test_lifespan_uses_global_settings_by_default(monkeypatch):
+    monkeypatch.setenv("SEARCH_MAX_PAGES", "4")
+    monkeypatch.setenv("PREWARM_CONNECTIONS", "0")
+    monkeypatch.setenv("LOG_FILE", "")
+    import settings as settings_module
+
+    settings_module.get_settings.cache_clear()
+    try:
+        app = create_app()
+        assert app.state.settings is None
+        with TestClient(app):
+            assert app.state.search_pager.max_pages == 4
+    finally:
+        settings_module.get_settings.cache_clear()
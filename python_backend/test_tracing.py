@@ -0,0 +1,112 @@
+import re
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import tracing
+from settings import Settings
+
+pytest.importorskip("opentelemetry.sdk")
+from opentelemetry import trace  # noqa: E402
+from opentelemetry.sdk.trace import TracerProvider  # noqa: E402
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor  # noqa: E402
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (  # noqa: E402
+    InMemorySpanExporter,
+)
+
+TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+TRACEPARENT = f"00-{TRACE_ID}-b7ad6b7169203331-01"
+
+# 全局TracerProvider只能设置一次，所有测试共享同一个内存导出器
+EXPORTER = InMemorySpanExporter()
+_provider = TracerProvider()
+_provider.add_span_processor(SimpleSpanProcessor(EXPORTER))
+trace.set_tracer_provider(_provider)
+
+
+def build_app():
+    """一个带追踪中间件的最小应用，返回传给上游的追踪请求头"""
+    app = FastAPI()
+    app.middleware("http")(tracing.trace_request)
+
+    @app.get("/upstream")
+    def upstream():
+        with tracing.start_span("cache.lookup", {"cache.key": "chat:q"}):
+            pass
+        with tracing.start_span("searxng.fetch"):
+            return tracing.trace_headers()
+
+    return app
+
+
+@pytest.fixture
+def client():
+    tracing.setup_tracing(Settings(tracing_exporter="none"))
+    EXPORTER.clear()
+    return TestClient(build_app())
+
+
+def test_traceparent_becomes_request_id(client):
+    response = client.get("/upstream", headers={"traceparent": TRACEPARENT})
+    assert response.headers["X-Request-ID"] == TRACE_ID
+
+
+def test_child_spans_are_exported_under_the_request_span(client):
+    client.get("/upstream", headers={"traceparent": TRACEPARENT})
+    # 新版FastAPI自身也会创建span，这里只检查本服务创建的span
+    finished = EXPORTER.get_finished_spans()
+    span_ids = {span.context.span_id for span in finished}
+    server = next(
+        span
+        for span in finished
+        if span.name == "GET /upstream"
+        and span.attributes.get("http.response.status_code") == 200
+    )
+    assert server.kind == trace.SpanKind.SERVER
+    assert format(server.context.trace_id, "032x") == TRACE_ID
+
+    spans = {span.name: span for span in finished}
+    for name in ("cache.lookup", "searxng.fetch"):
+        assert format(spans[name].context.trace_id, "032x") == TRACE_ID
+        # 子span挂在本次请求的span下，而不是直接挂在上游传入的span下
+        assert spans[name].parent.span_id in span_ids
+    assert spans["cache.lookup"].attributes["cache.key"] == "chat:q"
+
+
+def test_trace_headers_propagate_to_upstream(client):
+    headers = client.get("/upstream", headers={"traceparent": TRACEPARENT}).json()
+    fetch_span = next(
+        span
+        for span in EXPORTER.get_finished_spans()
+        if span.name == "searxng.fetch"
+    )
+    assert headers["traceparent"] == (
+        f"00-{TRACE_ID}-{format(fetch_span.context.span_id, '016x')}-01"
+    )
+
+
+def test_new_trace_without_incoming_traceparent(client):
+    response = client.get("/upstream")
+    request_id = response.headers["X-Request-ID"]
+    assert re.fullmatch("[0-9a-f]{32}", request_id)
+    assert request_id != TRACE_ID
+    assert request_id in response.json()["traceparent"]
+
+
+def test_noop_when_opentelemetry_is_not_loaded(client, monkeypatch):
+    monkeypatch.setattr(tracing, "trace", None)
+    response = client.get("/upstream", headers={"traceparent": TRACEPARENT})
+    assert re.fullmatch("[0-9a-f]{32}", response.headers["X-Request-ID"])
+    assert response.json() == {}
+    names = {span.name for span in EXPORTER.get_finished_spans()}
+    assert not names & {"cache.lookup", "searxng.fetch"}
+
+
+def test_file_exporter_closes_its_file_on_shutdown(tmp_path):
+    provider = tracing.setup_tracing(
+        Settings(tracing_exporter="file", tracing_file_path=str(tmp_path / "t.jsonl"))
+    )
+    processor = provider._active_span_processor._span_processors[0]
+    provider.shutdown()
+    assert processor.span_exporter.out.closed
@@ -0,0 +1,145 @@
+import contextvars
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger("perplexica-redis-cache")
+
+# OpenTelemetry在setup_tracing中按需导入，导入前所有追踪函数均为空操作
+trace = None
+extract = inject = None
+
+# 当前请求的ID（有追踪上下文时为trace id），用于日志关联
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+
+class RequestIdFilter(logging.Filter):
+    """为日志记录添加request_id字段"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _NoopSpan:
+    """未导入OpenTelemetry时使用的空span"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def get_span_context(self):
+        return None
+
+
+def setup_tracing(settings):
+    """导入OpenTelemetry并按配置初始化导出器
+
+    返回启用了导出的TracerProvider，未安装OpenTelemetry或导出方式为none时返回None；
+    即使不导出，导入后也会继续传播traceparent并把trace id用作请求ID。
+    """
+    global trace, extract, inject
+    try:
+        from opentelemetry import propagate
+        from opentelemetry import trace as otel_trace
+    except ImportError:  # pragma: no cover - 未安装OpenTelemetry时不做追踪
+        logger.warning("OpenTelemetry is not installed, tracing disabled")
+        return None
+    trace, extract, inject = otel_trace, propagate.extract, propagate.inject
+
+    exporter_name = settings.tracing_exporter
+    if exporter_name == "none":
+        return None
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if exporter_name == "otlp":
+        # 导出地址由标准的OTEL_EXPORTER_OTLP_ENDPOINT环境变量控制
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        exporter = OTLPSpanExporter()
+    elif exporter_name == "file":
+
+        class FileSpanExporter(ConsoleSpanExporter):
+            """把span逐行写入文件，关闭TracerProvider时关闭文件"""
+
+            def shutdown(self):
+                super().shutdown()
+                self.out.close()
+
+        exporter = FileSpanExporter(
+            out=open(settings.tracing_file_path, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + os.linesep,
+        )
+    else:
+        exporter = ConsoleSpanExporter()
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.tracing_service_name})
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Tracing enabled with {exporter_name} exporter")
+    return provider
+
+
+@contextmanager
+def start_span(name, attributes=None):
+    """创建一个子span，未导入OpenTelemetry时为空操作"""
+    if trace is None:
+        yield _NoopSpan()
+        return
+    tracer = trace.get_tracer("perplexica-redis-cache")
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        yield span
+
+
+def trace_headers():
+    """返回需要传给上游服务的追踪请求头（traceparent等）"""
+    headers = {}
+    if trace is not None:
+        inject(headers)
+    return headers
+
+
+async def trace_request(request, call_next):
+    """HTTP中间件：提取traceparent、创建服务端span并记录请求耗时"""
+    start_time = time.perf_counter()
+    name = f"{request.method} {request.url.path}"
+
+    if trace is None:
+        span_cm = start_span(name)
+    else:
+        tracer = trace.get_tracer("perplexica-redis-cache")
+        span_cm = tracer.start_as_current_span(
+            name,
+            context=extract(request.headers),
+            kind=trace.SpanKind.SERVER,
+            attributes={
+                "http.request.method": request.method,
+                "url.path": request.url.path,
+            },
+        )
+
+    with span_cm as span:
+        span_context = span.get_span_context()
+        if span_context is not None and span_context.is_valid:
+            request_id = format(span_context.trace_id, "032x")
+        else:
+            request_id = uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        try:
+            response = await call_next(request)
+            span.set_attribute("http.response.status_code", response.status_code)
+        finally:
+            duration_ms = (time.perf_counter() - start_time) * 1000
+            logger.info(f"{name} completed in {duration_ms:.1f}ms")
+            request_id_var.reset(token)
+
+    response.headers["X-Request-ID"] = request_id
+    return response